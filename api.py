@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import duckdb
+
+import cache
+import query
+import store
+import summary
+
+# Headless HTTP/JSON query API over the persisted store.
+#
+# A small asyncio server (standard library only) that answers the same
+# questions as the Backtest and Laporan tabs without going through Streamlit
+# reruns. Queries run on a thread pool, each on its own cursor of one
+# read-only connection, and share a cache.ResultCache, so repeated filters
+# are answered from memory like in main.py. The store is re-checked every
+# RELOAD_SECONDS; a new version gets a fresh pool and cache while requests
+# in flight finish on the old one.
+#
+#     python api.py --port 8000
+#
+#     GET /health
+#     GET /summary
+#     GET /results?preset=Long%20Term&indicators=RSI,MACD&sharpe_range=0.3,1
+#                 &sort=Return%20[%25]&order=desc&page_size=50&page=0&full=1
+#
+# /results takes any range of query.RANGES as "<name>=low,high" on top of an
+# optional preset, and returns "next", the keyset cursor to pass back as
+# "after" (JSON) for the following page.
+
+HOST = os.environ.get("BACKTEST_API_HOST", "127.0.0.1")
+PORT = int(os.environ.get("BACKTEST_API_PORT", "8000"))
+POOL_SIZE = int(os.environ.get("BACKTEST_API_POOL", str(os.cpu_count() or 4)))
+RELOAD_SECONDS = 5
+MAX_PAGE_SIZE = 1000
+MAX_REQUEST_BYTES = 16 << 10
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+log = logging.getLogger("api")
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class Pool:
+    """Read-only cursors on one store version, handed out one per query."""
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self.conn = store.connect(db_path)
+        self.full = store.has_full(self.conn)
+        self.results = cache.ResultCache()
+        self._cursors = queue.SimpleQueue()
+        for _ in range(size):
+            self._cursors.put(self.conn.cursor())
+
+    def cached(self, key, compute):
+        return self.results.get(self.db_path, key, compute)
+
+    def run(self, fn, *args):
+        cursor = self._cursors.get()
+        try:
+            return fn(self, cursor, *args)
+        finally:
+            self._cursors.put(cursor)
+
+
+def _one(params, name, default=None):
+    values = params.get(name)
+    return values[-1] if values else default
+
+
+def _int(params, name, default, low, high):
+    try:
+        value = int(_one(params, name, default))
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer")
+    if not low <= value <= high:
+        raise BadRequest(f"{name} must be between {low} and {high}")
+    return value
+
+
+def _filters(params):
+    """(ranges, indicators) of a query string, as the sidebar would apply them."""
+    preset = _one(params, "preset")
+    if preset is not None and preset not in query.PRESETS:
+        raise BadRequest(f"unknown preset {preset!r}, expected one of {list(query.PRESETS)}")
+    ranges = dict(query.PRESETS[preset]) if preset else {}
+    for name in query.RANGES:
+        if name in params:
+            try:
+                low, high = (float(v) for v in _one(params, name).split(","))
+            except ValueError:
+                raise BadRequest(f"{name} must be 'low,high'")
+            ranges[name] = (low, high)
+    unknown = set(params) - set(query.RANGES) - {"preset", "indicators", "sort", "order", "page_size", "page", "after", "full"}
+    if unknown:
+        raise BadRequest(f"unknown parameters {sorted(unknown)}")
+    indicators = [i for value in params.get("indicators", []) for i in value.split(",") if i]
+    bad = set(indicators) - set(store.INDICATORS)
+    if bad:
+        raise BadRequest(f"unknown indicators {sorted(bad)}, expected some of {store.INDICATORS}")
+    return ranges, indicators
+
+
+def _relation(pool, params):
+    if _one(params, "full", "0") in ("", "0", "false"):
+        return store.TABLE
+    if not pool.full:
+        raise BadRequest("this store has no full result set")
+    return store.FULL_VIEW
+
+
+def _results(pool, cursor, params):
+    ranges, indicators = _filters(params)
+    relation = _relation(pool, params)
+    columns = pool.cached(("columns", relation), lambda: query.columns(cursor, relation))
+    sort_by = _one(params, "sort", query.DEFAULT_SORT)
+    if sort_by not in columns:
+        raise BadRequest(f"unknown sort column {sort_by!r}")
+    order = _one(params, "order", "desc")
+    if order not in ("asc", "desc"):
+        raise BadRequest("order must be 'asc' or 'desc'")
+    page_size = _int(params, "page_size", query.DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    page = _int(params, "page", 0, 0, 1 << 31)
+    after = _one(params, "after")
+    if after is not None:
+        try:
+            value, row_id = json.loads(after)
+            if value is not None and not isinstance(value, (str, int, float)):
+                raise TypeError
+            after = (value, int(row_id))
+        except (ValueError, TypeError):
+            raise BadRequest("after must be the JSON cursor [value, row_id] of a previous response")
+
+    matched = cache.count(pool.results, cursor, pool.db_path, ranges, indicators, relation)
+    df, cursor_next = cache.fetch_page(
+        pool.results, cursor, pool.db_path, ranges, indicators, sort_by, order == "desc", page_size, page, after, relation,
+    )
+    head = json.dumps({
+        "total": pool.cached(("total", relation), lambda: query.total(cursor, relation)),
+        "matched": matched,
+        "page": page,
+        "page_size": page_size,
+        "next": cursor_next if len(df) == page_size else None,
+    })
+    # pandas writes NaN as null, which json.dumps would not.
+    return head[:-1] + ', "rows": ' + df.to_json(orient="records", date_format="iso", double_precision=15) + "}"
+
+
+def _clean(value):
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+
+def _summary(pool, cursor, params):
+    if params:
+        raise BadRequest(f"unknown parameters {sorted(params)}")
+    return json.dumps({
+        "indicators": [{k: _clean(v) for k, v in row.items()} for row in summary.per_indicator(cursor)],
+        "report": summary.report(cursor),
+    })
+
+
+def _health(pool, cursor, params):
+    return json.dumps({
+        "status": "ok",
+        "store": os.path.basename(pool.db_path),
+        "full": pool.full,
+        "rows": query.total(cursor),
+        "cache": pool.results.stats(),
+    })
+
+
+ROUTES = {"/results": _results, "/summary": _summary, "/health": _health}
+
+
+class Server:
+    def __init__(self, pool_size=POOL_SIZE):
+        self.pool_size = pool_size
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+        self.pool = Pool(store.ensure_store(), pool_size)
+
+    async def reload(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(RELOAD_SECONDS)
+            # A failed check keeps serving the current version and tries again.
+            try:
+                db_path = await loop.run_in_executor(self.executor, store.ensure_store)
+                if db_path != self.pool.db_path:
+                    self.pool = await loop.run_in_executor(self.executor, Pool, db_path, self.pool_size)
+                    log.info("serving %s", db_path)
+            except Exception:
+                log.exception("reloading the store failed")
+
+    async def respond(self, target):
+        url = urlsplit(target)
+        route = ROUTES.get(url.path)
+        if route is None:
+            return 404, json.dumps({"error": f"no route {url.path}", "routes": list(ROUTES)})
+        params = parse_qs(url.query, keep_blank_values=True)
+        try:
+            pool = self.pool
+            body = await asyncio.get_running_loop().run_in_executor(self.executor, pool.run, route, params)
+        except BadRequest as error:
+            return 400, json.dumps({"error": str(error)})
+        except duckdb.Error as error:
+            # Values the query cannot use, e.g. a text cursor on a numeric sort.
+            return 400, json.dumps({"error": str(error).splitlines()[0]})
+        except Exception:
+            log.exception("GET %s failed", target)
+            return 500, json.dumps({"error": "internal error"})
+        return 200, body
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = request.decode("latin-1").split("\r\n")
+                method, target, version = (lines[0].split(" ") + ["", "", ""])[:3]
+                headers = dict(line.split(":", 1) for line in lines[1:] if ":" in line)
+                headers = {k.strip().lower(): v.strip() for k, v in headers.items()}
+                if method != "GET":
+                    status, body = 405, json.dumps({"error": "only GET is supported"})
+                else:
+                    status, body = await self.respond(target)
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close"
+                    and (version == "HTTP/1.1" or headers.get("connection", "").lower() == "keep-alive")
+                )
+                payload = body.encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST_BYTES)
+        reload = asyncio.create_task(self.reload())
+        print(f"serving {self.pool.db_path} on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reload.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the backtest results as a JSON API.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--pool", type=int, default=POOL_SIZE, help="cursors and query threads")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        asyncio.run(Server(args.pool).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
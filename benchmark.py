@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+import engine
+import query
+import store
+import sweep
+
+# Headless benchmark of load, filter and render latency.
+#
+# A synthetic result set in the TOP10000.csv schema ("Indicator Settings" and
+# the 14 metric columns) is generated per size and timed two ways: the way
+# main.py used to work (the CSV read into a DataFrame on every start, filtered
+# with a regex on the settings string, the whole result rendered) and the
+# columnar store it uses now. Every case runs `repeat` times after one warm-up
+# and the timings are written as JSON, so runs on two commits can be diffed.
+#
+#     python benchmark.py --rows 50000 500000 5000000 --out bench.json
+
+SIZES = [50_000, 500_000, 5_000_000]
+REPEAT = 5
+SLIDER_COMBINATIONS = 20
+CHUNK = 1_000_000
+
+
+def _settings_pool():
+    """Every "Indicator Settings" label of the sweep grids, per indicator."""
+    return {indicator: [engine.settings(indicator, p) for p in sweep.grid(indicator)] for indicator in sweep.GRIDS}
+
+
+def _chunk(rng, pool, rows):
+    indicator = rng.choice(list(pool), rows)
+    settings = np.empty(rows, object)
+    for name, labels in pool.items():
+        where = indicator == name
+        settings[where] = np.asarray(labels, object)[rng.integers(0, len(labels), where.sum())]
+    # Loosely shaped like the real exports: returns follow the Sharpe ratio.
+    sharpe = rng.normal(0.3, 0.25, rows)
+    annual = sharpe * rng.uniform(5, 15, rows)
+    trades = rng.integers(0, 300, rows)
+    win = rng.uniform(0, 90, rows)
+    return pd.DataFrame({
+        "Indicator Settings": settings,
+        "Equity Final [Rp]": engine.INITIAL_CASH * (1 + annual / 100) ** 10,
+        "Return [%]": ((1 + annual / 100) ** 10 - 1) * 100,
+        "Return Ann [%]": annual,
+        "Sharpe Ratio": sharpe,
+        "Sortino Ratio": sharpe * rng.uniform(1, 2, rows),
+        "Calmar Ratio": sharpe * rng.uniform(0.2, 1, rows),
+        "Max Drawdown [%]": -rng.uniform(2, 80, rows),
+        "Max Drawdown Duration": rng.integers(10, 2500, rows),
+        "Total Trades": trades,
+        "Win Rate [%]": np.where(trades > 0, win, np.nan),
+        "Profit Factor": rng.lognormal(4, 2, rows),
+        "Avg Trade [%]": rng.normal(3, 8, rows),
+        "Best Trade [%]": rng.uniform(0, 150, rows),
+        "Worst Trade [%]": -rng.uniform(0, 60, rows),
+    })
+
+
+def generate(path, rows, seed=0):
+    """Write `rows` synthetic results in the TOP10000.csv schema to `path`."""
+    rng = np.random.default_rng(seed)
+    pool = _settings_pool()
+    conn = duckdb.connect()
+    for start in range(0, rows, CHUNK):
+        frame = _chunk(rng, pool, min(CHUNK, rows - start))
+        if start == 0:
+            conn.execute("CREATE TABLE synthetic AS SELECT * FROM frame")
+        else:
+            conn.execute("INSERT INTO synthetic SELECT * FROM frame")
+    conn.execute(f"COPY synthetic TO {store._literal(path)} (HEADER, DELIMITER ',')")
+    conn.close()
+
+
+def _time(fn, repeat):
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "min_ms": min(samples),
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "max_ms": max(samples),
+        "repeat": repeat,
+    }
+
+
+def _random_ranges(rng, count):
+    """Slider states inside the bounds of the "No Filter" preset, which spans each slider."""
+    states = []
+    for _ in range(count):
+        ranges = {}
+        for name, (low, high) in query.PRESETS["No Filter"].items():
+            a, b = sorted(rng.uniform(low, high, 2))
+            ranges[name] = (a, b) if isinstance(low, float) else (int(a), int(b))
+        states.append(ranges)
+    return states
+
+
+def _legacy_sql(ranges, indicators):
+    # The filter main.py ran over the DataFrame before the store existed.
+    clauses = [f'"{query.RANGES[name]}" BETWEEN {low} AND {high}' for name, (low, high) in ranges.items()]
+    if indicators:
+        clauses.append(f"""regexp_matches("Indicator Settings", '{"|".join(indicators)}', 'i')""")
+    return f"SELECT * FROM df WHERE {' AND '.join(clauses) or 'TRUE'}"
+
+
+def _serialize(df):
+    # What st.dataframe does with the frame before sending it to the browser.
+    from streamlit import dataframe_util
+
+    return dataframe_util.convert_pandas_df_to_arrow_bytes(df)
+
+
+def bench_size(rows, directory, repeat=REPEAT, combinations=SLIDER_COMBINATIONS, seed=0):
+    results = []
+
+    def record(case, fn, **labels):
+        results.append({"rows": rows, "case": case, **labels, **_time(fn, repeat)})
+
+    csv = os.path.join(directory, f"synthetic-{rows}.csv")
+    start = time.perf_counter()
+    generate(csv, rows, seed)
+    generated = (time.perf_counter() - start) * 1000
+
+    # Cold start
+    record("cold_start", lambda: duckdb.connect().execute(f"SELECT * FROM {store.reader_sql(csv)}").df(), path="csv")
+    db_path = os.path.join(directory, f"synthetic-{rows}.duckdb")
+    start = time.perf_counter()
+    store.ingest(csv, db_path)
+    ingested = (time.perf_counter() - start) * 1000
+
+    def open_store():
+        conn = store.connect(db_path)
+        query.total(conn)
+        conn.close()
+
+    record("cold_start", open_store, path="store")
+
+    df = duckdb.connect().execute(f"SELECT * FROM {store.reader_sql(csv)}").df()
+    legacy = duckdb.connect()
+    legacy.register("df", df)
+    conn = store.connect(db_path)
+
+    # Presets: count and first page, as the Backtest tab shows them.
+    for preset, ranges in query.PRESETS.items():
+        record("preset", lambda: legacy.execute(_legacy_sql(ranges, store.INDICATORS)).df(), preset=preset, path="csv")
+        record("preset", lambda: (
+            query.count(conn, ranges, store.INDICATORS),
+            query.fetch_page(conn, ranges, store.INDICATORS, query.DEFAULT_SORT, True, query.DEFAULT_PAGE_SIZE),
+        ), preset=preset, path="store")
+
+    # Random slider states, each run once per timed sample.
+    states = _random_ranges(np.random.default_rng(seed), combinations)
+    record("sliders", lambda: [legacy.execute(_legacy_sql(r, store.INDICATORS)).df() for r in states],
+           combinations=combinations, path="csv")
+    record("sliders", lambda: [
+        (query.count(conn, r, store.INDICATORS),
+         query.fetch_page(conn, r, store.INDICATORS, query.DEFAULT_SORT, True, query.DEFAULT_PAGE_SIZE))
+        for r in states
+    ], combinations=combinations, path="store")
+
+    # Indicator match on the same table: regex over the settings string vs equality on the ingested column.
+    for selected in (["RSI"], ["CCI", "MACD", "STO"]):
+        pattern = "|".join(selected)
+        placeholders = ", ".join("?" * len(selected))
+        record("indicator_match", lambda: conn.execute(
+            f"""SELECT count(*) FROM {store.TABLE} WHERE regexp_matches("{store.SETTINGS_COLUMN}", ?, 'i')""", [pattern]
+        ).fetchone(), indicators=selected, match="regex")
+        record("indicator_match", lambda: conn.execute(
+            f"SELECT count(*) FROM {store.TABLE} WHERE indicator IN ({placeholders})", selected
+        ).fetchone(), indicators=selected, match="equality")
+
+    # Serialization for st.dataframe: the whole "No Filter" result as before, and one page as now.
+    everything = legacy.execute(_legacy_sql(query.PRESETS["No Filter"], store.INDICATORS)).df()
+    record("serialize", lambda: _serialize(everything), path="csv", frame_rows=len(everything))
+    page, _ = query.fetch_page(conn, query.PRESETS["No Filter"], store.INDICATORS, query.DEFAULT_SORT, True,
+                               query.DEFAULT_PAGE_SIZE)
+    record("serialize", lambda: _serialize(page), path="store", frame_rows=len(page))
+
+    conn.close()
+    legacy.close()
+    for path in (csv, db_path):
+        os.remove(path)
+    return {"rows": rows, "generate_ms": generated, "ingest_ms": ingested, "results": results}
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=SIZES, repeat=REPEAT, combinations=SLIDER_COMBINATIONS, seed=0, directory=None):
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        runs = []
+        for rows in sizes:
+            runs.append(bench_size(rows, tmp, repeat, combinations, seed))
+            print(f"{rows} rows done")
+    return {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.platform(),
+        "memory_limit": store.MEMORY_LIMIT,
+        "seed": seed,
+        "sizes": runs,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time load, filter and render paths on synthetic result sets.")
+    parser.add_argument("--rows", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--combinations", type=int, default=SLIDER_COMBINATIONS, help="random slider states per sample")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=None, help="where to write the generated files (defaults to the system temp dir)")
+    parser.add_argument("--out", default="benchmark.json")
+    args = parser.parse_args()
+    report = run(args.rows, args.repeat, args.combinations, args.seed, args.dir)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
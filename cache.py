@@ -0,0 +1,121 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import frontier
+import query
+import store
+
+# Filter results shared by every session of the process.
+#
+# Entries are keyed by the normalized filter state, so the same preset or
+# slider combination is answered from memory no matter which session asks.
+# The cache is bound to one dataset version; a new version empties it.
+
+MAX_ENTRIES = int(os.environ.get("BACKTEST_CACHE_ENTRIES", "512"))
+MAX_BYTES = int(os.environ.get("BACKTEST_CACHE_BYTES", str(128 << 20)))
+
+
+def filter_key(ranges, indicators):
+    """Normalized, hashable form of the sidebar state."""
+    return (
+        tuple(sorted(set(indicators))),
+        tuple((name, float(low), float(high)) for name, (low, high) in sorted(ranges.items())),
+    )
+
+
+def _sizeof(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """Thread-safe LRU bounded by entry count and approximate bytes."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _reset(self, version):
+        self._entries.clear()
+        self._bytes = 0
+        self.version = version
+
+    def get(self, version, key, compute):
+        """Return the cached value for key, computing and storing it on a miss."""
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        # Computed outside the lock so slow queries don't serialize sessions.
+        value = compute()
+        size = _sizeof(value)
+        with self._lock:
+            if version != self.version or size > self.max_bytes or key in self._entries:
+                return value
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+def count(results, conn, version, ranges, indicators, relation):
+    key = ("count", relation, filter_key(ranges, indicators))
+    return results.get(version, key, lambda: query.count(conn, ranges, indicators, relation))
+
+
+def fetch_page(results, conn, version, ranges, indicators, sort_by, descending, page_size, page, after, relation):
+    key = ("page", relation, filter_key(ranges, indicators), sort_by, descending, page_size, page, after)
+    return results.get(
+        version,
+        key,
+        lambda: query.fetch_page(conn, ranges, indicators, sort_by, descending, page_size, page, after, relation),
+    )
+
+
+def facets(results, conn, version, ranges, indicators, relation):
+    key = ("facets", relation, filter_key(ranges, indicators))
+    return results.get(version, key, lambda: query.facets(conn, ranges, indicators, relation))
+
+
+def fetch_frontier(results, conn, version, ranges, indicators, metrics, maximize, layers, relation):
+    key = ("frontier", relation, filter_key(ranges, indicators), tuple(metrics), tuple(maximize), layers)
+    return results.get(
+        version,
+        key,
+        lambda: frontier.frontier(conn, ranges, indicators, metrics, maximize, layers, relation),
+    )
+
+
+def prewarm(results, conn, version, relations):
+    """Load the count and first page of every preset, as the sidebar first shows them."""
+    for ranges in query.PRESETS.values():
+        for relation in relations:
+            count(results, conn, version, ranges, store.INDICATORS, relation)
+            fetch_page(
+                results, conn, version, ranges, store.INDICATORS,
+                query.DEFAULT_SORT, True, query.DEFAULT_PAGE_SIZE, 0, None, relation,
+            )
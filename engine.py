@@ -0,0 +1,487 @@
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Vectorized backtest engine for the five indicators in the report.
+#
+# A simulation is one parameter set traded over a panel of T tickers with a
+# shared cash balance, following the rules in "Metodologi Backtest": Rp100.000.000
+# starting capital, 5% of cash per order, long only, at most one order per
+# ticker per day, no costs, open positions valued at the last close. Orders
+# are decided on the close and filled at the next bar's open, as Backtrader
+# does with market orders. A whole batch of K parameter sets is simulated at
+# once: indicator series are arrays of shape (K, T, n) and the bar loop works
+# on (K, T) state arrays, so the Python-level loop is per bar, not per run.
+#
+# Metrics follow the definitions the app displays (Sharpe = annualized
+# geometric return over annualized volatility, 252 trading days) and are
+# computed from running accumulators held in the simulation state, which is
+# what lets a run be resumed with more bars later: run() given a saved state
+# simulates only the bars after it.
+
+INITIAL_CASH = 100_000_000
+ALLOCATION = 0.05
+TRADING_DAYS = 252
+
+PARAMS = {
+    "RSI": ("period", "lower", "upper"),
+    "CCI": ("period", "lower", "upper"),
+    "STO": ("k", "slowk", "slowd", "upper", "lower"),
+    "SMACross": ("fast", "slow"),
+    "MACD": ("fast", "slow", "signal"),
+}
+
+COLUMNS = [
+    "Indicator Settings",
+    "Ticker",
+    "Equity Final [Rp]",
+    "Return [%]",
+    "Return Ann [%]",
+    "Sharpe Ratio",
+    "Sortino Ratio",
+    "Calmar Ratio",
+    "Max Drawdown [%]",
+    "Max Drawdown Duration",
+    "Total Trades",
+    "Win Rate [%]",
+    "Profit Factor",
+    "Avg Trade [%]",
+    "Best Trade [%]",
+    "Worst Trade [%]",
+]
+
+
+def load_prices(directory, tickers, start="2012-01-01", end="2022-12-31"):
+    """Read `<directory>/<TICKER>.csv` (Date, Open, High, Low, Close) into aligned arrays.
+
+    Returns (dates, prices) where prices maps open/high/low/close to arrays of
+    shape (T, n) on the union of trading dates, forward-filled per ticker.
+    """
+    frames = {}
+    for ticker in tickers:
+        df = pd.read_csv(f"{directory}/{ticker}.csv", parse_dates=["Date"], index_col="Date")
+        frames[ticker] = df.loc[start:end, ["Open", "High", "Low", "Close"]]
+    panel = pd.concat(frames, axis=1).sort_index().ffill()
+    dates = panel.index.values
+    prices = {
+        field.lower(): np.stack([panel[(t, field)].to_numpy(float) for t in tickers])
+        for field in ["Open", "High", "Low", "Close"]
+    }
+    return dates, prices
+
+
+# Indicators. Price inputs are (T, n); parameter arrays are (K,); outputs are
+# (K, T, n) with NaN during warm-up, matching TA-Lib's definitions.
+
+def _smooth(x, spans, alpha):
+    """Recursive smoothing seeded with the SMA of the first `span` valid values.
+
+    x is (..., n) and spans/alpha broadcast over its leading axes. With
+    alpha = 2 / (span + 1) this is TA-Lib's EMA, with alpha = 1 / span it is
+    Wilder's smoothing.
+    """
+    x = np.asarray(x, float)
+    shape = x.shape
+    spans = np.broadcast_to(spans, shape[:-1]).reshape(-1).astype(int)
+    alpha = np.broadcast_to(alpha, shape[:-1]).reshape(-1)
+    x = x.reshape(-1, shape[-1])
+    m, n = x.shape
+    valid = ~np.isnan(x)
+    first = np.where(valid.any(1), valid.argmax(1), n)
+    seed_at = first + spans - 1
+    csum = np.concatenate([np.zeros((m, 1)), np.cumsum(np.nan_to_num(x), 1)], 1)
+    rows = np.flatnonzero(seed_at < n)
+    seed = np.full(m, np.nan)
+    seed[rows] = (csum[rows, seed_at[rows] + 1] - csum[rows, first[rows]]) / spans[rows]
+    out = np.empty((m, n))
+    prev = np.full(m, np.nan)
+    for t in range(n):
+        prev = np.where(seed_at == t, seed, prev + alpha * (x[:, t] - prev))
+        out[:, t] = prev
+    return out.reshape(shape)
+
+
+def _by_unique(values, compute, series=None, name=None):
+    """Evaluate compute once per distinct value (or row) of `values` and gather the results back to (K, ...).
+
+    compute maps the array of distinct values to their stacked results. With
+    `series` (a series.Series), results are looked up under `name` and only
+    the missing values are computed.
+    """
+    unique, inverse = np.unique(np.asarray(values, float), axis=0, return_inverse=True)
+    out = compute(unique) if series is None else series.lookup(name, unique, compute)
+    return out[inverse.reshape(-1)]
+
+
+def _each(one):
+    return lambda values: np.stack([one(v) for v in values])
+
+
+def _percent(part, total):
+    """100 * part / total, 0 where total is 0 and NaN where either is NaN."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = 100 * part / total
+    out[total == 0] = 0
+    return out
+
+
+def _rolling(x, window, reduce):
+    out = np.full(x.shape, np.nan)
+    out[..., window - 1:] = reduce(sliding_window_view(x, window, axis=-1), axis=-1)
+    return out
+
+
+def _running(x):
+    return np.concatenate([np.zeros(x.shape[:-1] + (1,)), np.cumsum(x, -1)], -1)
+
+
+def sma(x, windows, series=None):
+    def compute(windows):
+        # Every window from the same running sum: one subtraction per bar.
+        w = windows.astype(int).reshape((-1,) + (1,) * np.ndim(x))
+        end = np.arange(1, x.shape[-1] + 1)
+        start = np.clip(end - w.reshape(-1, 1), 0, None)
+        csum, count = _running(np.nan_to_num(x)), _running(~np.isnan(x))
+        total = csum[..., end] - np.moveaxis(csum[..., start], -2, 0)
+        full = count[..., end] - np.moveaxis(count[..., start], -2, 0) == w
+        return np.where(full, total / w, np.nan)
+
+    return _by_unique(windows, compute, series, "sma")
+
+
+def ema(x, spans):
+    spans = np.asarray(spans, float).reshape((-1,) + (1,) * (np.ndim(x) - 1))
+    return _smooth(np.broadcast_to(x, spans.shape[:1] + np.shape(x)), spans, 2 / (spans + 1))
+
+
+def rsi(close, periods, series=None):
+    diff = np.diff(close, prepend=np.nan, axis=-1)
+
+    def compute(periods):
+        p = periods[:, None]
+        shape = periods.shape + diff.shape
+        gain = _smooth(np.broadcast_to(np.clip(diff, 0, None), shape), p, 1 / p)
+        loss = _smooth(np.broadcast_to(np.clip(-diff, 0, None), shape), p, 1 / p)
+        return _percent(gain, gain + loss)
+
+    return _by_unique(periods, compute, series, "rsi")
+
+
+def cci(high, low, close, periods, series=None):
+    typical = (high + low + close) / 3
+
+    def one(p):
+        p = int(p)
+        window = sliding_window_view(typical, p, axis=-1)
+        mean = window.mean(-1)
+        deviation = np.abs(window - mean[..., None]).mean(-1)
+        out = np.full(typical.shape, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[..., p - 1:] = (typical[..., p - 1:] - mean) / (0.015 * deviation)
+        return out
+
+    return _by_unique(periods, _each(one), series, "cci")
+
+
+def stoch(high, low, close, k, slowk, slowd, series=None):
+    """Full stochastic with EMA-smoothed %K and %D, as used in the report."""
+    def fast(p):
+        p = int(p)
+        lowest = _rolling(low, p, np.min)
+        return _percent(close - lowest, _rolling(high, p, np.max) - lowest)
+
+    def smoothed(rows, previous, name):
+        # Each stage smooths the stage before it, so all of them are shared.
+        span = rows[:, -1:]
+        return _smooth(_by_unique(rows[:, :-1], previous, series, name), span, 2 / (span + 1))
+
+    def k_line(rows):
+        return smoothed(rows, lambda r: _each(fast)(r[:, 0]), "stoch_fast")
+
+    rows = np.stack([k, slowk, slowd], 1)
+    return (
+        _by_unique(rows[:, :2], k_line, series, "stoch_k"),
+        _by_unique(rows, lambda r: smoothed(r, k_line, "stoch_k"), series, "stoch_d"),
+    )
+
+
+def macd(close, fast, slow, signal, series=None):
+    first = (~np.isnan(close)).argmax(-1)
+
+    def fast_ema(pairs):
+        # TA-Lib seeds the fast EMA on the bar where the slow one starts.
+        f, s = pairs[:, :1], pairs[:, 1:]
+        start = first + np.maximum(s - f, 0).astype(int)
+        shifted = np.where(np.arange(close.shape[-1]) < start[..., None], np.nan, close)
+        return _smooth(shifted, f, 2 / (f + 1))
+
+    def line(pairs):
+        return (
+            _by_unique(pairs, fast_ema, series, "macd_fast")
+            - _by_unique(pairs[:, 1], lambda s: ema(close, s), series, "ema")
+        )
+
+    def signal_line(rows):
+        span = rows[:, 2:]
+        return _smooth(_by_unique(rows[:, :2], line, series, "macd_line"), span, 2 / (span + 1))
+
+    rows = np.stack([fast, slow, signal], 1)
+    return (
+        _by_unique(rows[:, :2], line, series, "macd_line"),
+        _by_unique(rows, signal_line, series, "macd_signal"),
+    )
+
+
+# Signals: boolean (K, T, n) arrays evaluated on each bar's close.
+
+def _previous(x):
+    out = np.full(x.shape, np.nan)
+    out[..., 1:] = x[..., :-1]
+    return out
+
+
+def _cross_up(a, b):
+    return (a > b) & (_previous(a) <= _previous(b))
+
+
+def _cross_down(a, b):
+    return (a < b) & (_previous(a) >= _previous(b))
+
+
+def _column(params, indicator, name):
+    return params[:, PARAMS[indicator].index(name)]
+
+
+def signals(indicator, params, prices, series=None):
+    """Entry and exit signals for each parameter set in `params` (K, len(PARAMS[indicator])).
+
+    RSI/CCI buy below the lower level and sell above the upper one. STO buys
+    when %K crosses above %D under the lower level and sells when it crosses
+    below %D over the upper level. SMACross and MACD trade the crossovers.
+    With `series`, indicator values are shared with earlier calls on the same
+    prices.
+    """
+    params = np.asarray(params, float)
+    high, low, close = prices["high"], prices["low"], prices["close"]
+
+    def col(name):
+        return _column(params, indicator, name)[:, None, None]
+
+    with np.errstate(invalid="ignore"):
+        if indicator in ("RSI", "CCI"):
+            period = _column(params, indicator, "period")
+            line = rsi(close, period, series) if indicator == "RSI" else cci(high, low, close, period, series)
+            return line < col("lower"), line > col("upper")
+        if indicator == "STO":
+            k_line, d_line = stoch(
+                high, low, close,
+                _column(params, "STO", "k"), _column(params, "STO", "slowk"), _column(params, "STO", "slowd"),
+                series,
+            )
+            return (
+                _cross_up(k_line, d_line) & (k_line < col("lower")),
+                _cross_down(k_line, d_line) & (k_line > col("upper")),
+            )
+        if indicator == "SMACross":
+            fast = sma(close, _column(params, indicator, "fast"), series)
+            slow = sma(close, _column(params, indicator, "slow"), series)
+            return _cross_up(fast, slow), _cross_down(fast, slow)
+        if indicator == "MACD":
+            line, signal = macd(
+                close,
+                _column(params, "MACD", "fast"), _column(params, "MACD", "slow"), _column(params, "MACD", "signal"),
+                series,
+            )
+            return _cross_up(line, signal), _cross_down(line, signal)
+    raise ValueError(f"Unknown indicator: {indicator}")
+
+
+# Simulation
+
+def new_state(k, t):
+    """Zeroed simulation state for K parameter sets over T tickers."""
+    zeros = np.zeros(k)
+    return {
+        "bars": 0,
+        "cash": np.full(k, float(INITIAL_CASH)),
+        "shares": np.zeros((k, t)),
+        "entry_price": np.zeros((k, t)),
+        "pending_size": np.zeros((k, t)),
+        "pending_sell": np.zeros((k, t), bool),
+        "equity": np.full(k, float(INITIAL_CASH)),
+        "last_day": None,
+        # Drawdown
+        "peak": np.full(k, float(INITIAL_CASH)),
+        "peak_day": np.full(k, np.nan),
+        "max_drawdown": zeros.copy(),
+        "max_drawdown_days": zeros.copy(),
+        # Daily return moments
+        "returns": zeros.copy(),
+        "sum_log_return": zeros.copy(),
+        "sum_return": zeros.copy(),
+        "sum_return_sq": zeros.copy(),
+        "sum_downside_sq": zeros.copy(),
+        # Closed trades
+        "trades": zeros.copy(),
+        "wins": zeros.copy(),
+        "gross_profit": zeros.copy(),
+        "gross_loss": zeros.copy(),
+        "sum_log_trade": zeros.copy(),
+        "best_trade": np.full(k, -np.inf),
+        "worst_trade": np.full(k, np.inf),
+    }
+
+
+def _record_trades(state, returns, closed):
+    r = np.where(closed, returns, 0.0)
+    state["trades"] += closed.sum(1)
+    state["wins"] += (closed & (returns > 0)).sum(1)
+    state["gross_profit"] += np.where(r > 0, r, 0).sum(1)
+    state["gross_loss"] += np.where(r < 0, r, 0).sum(1)
+    state["sum_log_trade"] += np.log1p(r).sum(1)
+    state["best_trade"] = np.maximum(state["best_trade"], np.where(closed, returns, -np.inf).max(1))
+    state["worst_trade"] = np.minimum(state["worst_trade"], np.where(closed, returns, np.inf).min(1))
+
+
+def simulate(state, prices, days, entries, exits):
+    """Advance `state` in place over the bars of `prices`.
+
+    prices holds (T, n) open/close arrays, days the bar dates as day numbers
+    (n,), entries/exits (K, T, n) signals for those same bars.
+    """
+    opens, closes = prices["open"], prices["close"]
+    s = state
+    for t in range(closes.shape[-1]):
+        o, c, day = opens[:, t], closes[:, t], float(days[t])
+
+        # Fill yesterday's orders at today's open: sells first, then buys while cash lasts.
+        sell = s["pending_sell"]
+        if sell.any():
+            _record_trades(s, o / np.where(sell, s["entry_price"], 1) - 1, sell)
+            s["cash"] += np.where(sell, s["shares"] * o, 0).sum(1)
+            s["shares"][sell] = 0
+        buy = s["pending_size"] > 0
+        if buy.any():
+            cost = s["pending_size"] * o
+            filled = buy & (np.cumsum(np.where(buy, cost, 0), 1) <= s["cash"][:, None])
+            s["cash"] -= np.where(filled, cost, 0).sum(1)
+            s["shares"] = np.where(filled, s["pending_size"], s["shares"])
+            s["entry_price"] = np.where(filled, o, s["entry_price"])
+
+        # Mark to market on the close.
+        equity = s["cash"] + np.where(s["shares"] > 0, s["shares"] * c, 0).sum(1)
+        if s["bars"]:
+            r = equity / s["equity"] - 1
+            s["returns"] += 1
+            s["sum_log_return"] += np.log1p(r)
+            s["sum_return"] += r
+            s["sum_return_sq"] += r * r
+            s["sum_downside_sq"] += np.minimum(r, 0) ** 2
+        s["equity"] = equity
+        s["bars"] += 1
+        new_peak = equity >= s["peak"]
+        s["peak"] = np.where(new_peak, equity, s["peak"])
+        s["peak_day"] = np.where(new_peak, day, s["peak_day"])
+        s["max_drawdown"] = np.maximum(s["max_drawdown"], 1 - equity / s["peak"])
+        s["max_drawdown_days"] = np.maximum(s["max_drawdown_days"], day - s["peak_day"])
+
+        # Orders for tomorrow's open, sized on today's close.
+        holding = s["shares"] > 0
+        s["pending_sell"] = holding & exits[:, :, t]
+        size = np.floor(s["cash"][:, None] * ALLOCATION / c)
+        s["pending_size"] = np.where(~holding & entries[:, :, t] & (size > 0), size, 0)
+        s["last_day"] = day
+    return state
+
+
+def metrics(state, last_close):
+    """Metric columns (K,) for the state, selling open positions at `last_close` (T,)."""
+    s = {name: value.copy() if isinstance(value, np.ndarray) else value for name, value in state.items()}
+    holding = s["shares"] > 0
+    if holding.any():
+        _record_trades(s, last_close / np.where(holding, s["entry_price"], 1) - 1, holding)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n = s["returns"]
+        gmean = np.expm1(s["sum_log_return"] / n)
+        annual = (1 + gmean) ** TRADING_DAYS - 1
+        variance = (s["sum_return_sq"] - s["sum_return"] ** 2 / n) / (n - 1)
+        volatility = np.sqrt(np.maximum(
+            (variance + (1 + gmean) ** 2) ** TRADING_DAYS - (1 + gmean) ** (2 * TRADING_DAYS), 0
+        ))
+        downside = np.sqrt(s["sum_downside_sq"] / n) * np.sqrt(TRADING_DAYS)
+        trades = s["trades"]
+        return {
+            "Equity Final [Rp]": s["equity"],
+            "Return [%]": (s["equity"] / INITIAL_CASH - 1) * 100,
+            "Return Ann [%]": annual * 100,
+            "Sharpe Ratio": np.where(volatility > 0, annual / volatility, np.nan),
+            "Sortino Ratio": np.where(downside > 0, annual / downside, np.nan),
+            "Calmar Ratio": np.where(s["max_drawdown"] > 0, annual / s["max_drawdown"], np.nan),
+            "Max Drawdown [%]": -s["max_drawdown"] * 100,
+            "Max Drawdown Duration": s["max_drawdown_days"].astype(int),
+            "Total Trades": trades.astype(int),
+            "Win Rate [%]": np.where(trades > 0, s["wins"] / trades * 100, np.nan),
+            "Profit Factor": np.where(s["gross_loss"] < 0, s["gross_profit"] / -s["gross_loss"], np.nan),
+            "Avg Trade [%]": np.where(trades > 0, np.expm1(s["sum_log_trade"] / trades) * 100, np.nan),
+            "Best Trade [%]": np.where(trades > 0, s["best_trade"] * 100, np.nan),
+            "Worst Trade [%]": np.where(trades > 0, s["worst_trade"] * 100, np.nan),
+        }
+
+
+def settings(indicator, values):
+    """The "Indicator Settings" label, e.g. "RSI 5,39,91" or "STO 32,8,6 (86,24)"."""
+    text = [f"{v:g}" for v in values]
+    if indicator == "STO":
+        return f"STO {','.join(text[:3])} ({','.join(text[3:])})"
+    return f"{indicator} {','.join(text)}"
+
+
+def day_numbers(dates):
+    return np.asarray(dates, "datetime64[D]").astype(np.int64).astype(float)
+
+
+def save_state(path, state, **extra):
+    """Write a simulation state (plus any extra arrays) to an .npz file atomically."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **{name: np.asarray(np.nan if value is None else value) for name, value in state.items()}, **extra)
+    os.replace(tmp, path)
+
+
+def load_state(path):
+    """Read back a file from save_state(); returns (state, extra)."""
+    with np.load(path) as data:
+        values = {name: data[name] for name in data.files}
+    state = {name: values.pop(name) for name in new_state(0, 0)}
+    for name in ("bars", "last_day"):
+        state[name] = state[name].item()
+    if np.isnan(state["last_day"]):
+        state["last_day"] = None
+    return state, values
+
+
+def run(indicator, params, dates, prices, ticker="ALL", series=None, state=None):
+    """Backtest every parameter set in `params` and return rows in the TOP10000.csv schema.
+
+    With `state` (from new_state() or an earlier run on the first bars of the
+    same history), only the bars after state["last_day"] are simulated and
+    the state is advanced in place; the indicators are still computed over
+    the whole history so their warm-up is unchanged.
+    """
+    params = np.asarray(params, float).reshape(-1, len(PARAMS[indicator]))
+    if state is None:
+        state = new_state(len(params), prices["close"].shape[0])
+    days = day_numbers(dates)
+    start = 0 if state["last_day"] is None else int(np.searchsorted(days, state["last_day"], "right"))
+    entries, exits = signals(indicator, params, prices, series)
+    simulate(
+        state, {field: values[:, start:] for field, values in prices.items()}, days[start:],
+        entries[:, :, start:], exits[:, :, start:],
+    )
+    df = pd.DataFrame(metrics(state, prices["close"][:, -1]))
+    df.insert(0, "Ticker", ticker)
+    df.insert(0, "Indicator Settings", [settings(indicator, p) for p in params])
+    return df[COLUMNS]
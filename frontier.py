@@ -0,0 +1,198 @@
+import numpy as np
+
+import query
+import store
+
+# Pareto frontier (skyline) over the backtest metrics.
+#
+# A backtest is on the frontier when no other backtest is at least as good on
+# every chosen metric and strictly better on one. Only row_id and the chosen
+# metric columns of the current filter result are read, the skyline is
+# computed in NumPy, and the full rows of the survivors are fetched by row_id.
+# Layers peel the frontier: layer 2 is the frontier of what remains after
+# removing layer 1, and so on.
+
+# Metric -> True when higher is better. Max Drawdown is stored as a negative
+# percentage, so higher is better there too.
+METRICS = {
+    "Sharpe Ratio": True,
+    "Max Drawdown [%]": True,
+    "Win Rate [%]": True,
+    "Return [%]": True,
+    "Return Ann [%]": True,
+    "Sortino Ratio": True,
+    "Calmar Ratio": True,
+    "Profit Factor": True,
+    "Avg Trade [%]": True,
+    "Total Trades": True,
+    "Robustness": True,
+    "Max Drawdown Duration": False,
+}
+DEFAULT_METRICS = ["Sharpe Ratio", "Max Drawdown [%]", "Win Rate [%]"]
+MAX_LAYERS = 5
+LAYER_COLUMN = "Layer"
+# Below these sizes the divide-and-conquer steps compare rows pairwise.
+LEAF = 128
+SMALL = 1 << 15
+# Cells of the grid that rules out rows before the exact skyline.
+MAX_CELLS = 1 << 20
+
+
+def _sorted_unique(values):
+    """Distinct rows in descending lexicographic order, and each row's index among them."""
+    order = np.lexsort([-values[:, j] for j in reversed(range(values.shape[1]))])
+    ordered = values[order]
+    new = np.ones(len(values), bool)
+    new[1:] = (ordered[1:] != ordered[:-1]).any(1)
+    inverse = np.empty(len(values), int)
+    inverse[order] = np.cumsum(new) - 1
+    return ordered[new], inverse
+
+
+def _staircase(by, points):
+    # Sorted by the first column, the running maximum of the second column is
+    # the best second value among all rows at least as high on the first.
+    order = np.argsort(-by[:, 0], kind="stable")
+    best = np.maximum.accumulate(by[order, 1])
+    count = np.searchsorted(-by[order, 0], -points[:, 0], side="right")
+    return (count > 0) & (best[np.maximum(count - 1, 0)] >= points[:, 1])
+
+
+def _covered(by, points):
+    """For each row of `points`, whether some row of `by` is >= on every column."""
+    if not len(by) or not len(points):
+        return np.zeros(len(points), bool)
+    if by.shape[1] == 1:
+        return by[:, 0].max() >= points[:, 0]
+    if by.shape[1] == 2:
+        return _staircase(by, points)
+    if len(points) < 2 or len(by) * len(points) <= SMALL:
+        return (by[:, None, :] >= points[None, :, :]).all(-1).any(0)
+    # Split the points at their median on the first column. Rows of `by` at
+    # or above it beat every lower point there, leaving one column fewer.
+    order = np.argsort(points[:, 0], kind="stable")
+    low, high = order[:len(order) // 2], order[len(order) // 2:]
+    upper = by[:, 0] >= points[high[0], 0]
+    out = np.empty(len(points), bool)
+    out[high] = _covered(by[upper], points[high])
+    out[low] = _covered(by[upper, 1:], points[low, 1:]) | _covered(by[~upper], points[low])
+    return out
+
+
+def _front(points):
+    """Skyline mask of distinct rows sorted in descending lexicographic order.
+
+    In that order no row is dominated by a later one, and a row dominates an
+    earlier one exactly when it is >= on every column.
+    """
+    if points.shape[1] == 2:
+        before = np.concatenate([[-np.inf], np.maximum.accumulate(points[:-1, 1])])
+        return before < points[:, 1]
+    if len(points) <= LEAF:
+        covers = np.triu((points[:, None, :] >= points[None, :, :]).all(-1), 1)
+        return ~covers.any(0)
+    # Divide and conquer (Kung et al.): the first half already beats the
+    # second on the first column, so only the rest is left to compare.
+    half = len(points) // 2
+    first, second = _front(points[:half]), _front(points[half:])
+    candidates = np.flatnonzero(second)
+    second[candidates] = ~_covered(points[:half][first, 1:], points[half:][candidates, 1:])
+    return np.concatenate([first, second])
+
+
+def _strictly_above(grid):
+    """Cells with a marked cell strictly above them on every axis."""
+    for axis in range(grid.ndim):
+        suffix = np.flip(np.logical_or.accumulate(np.flip(grid, axis), axis), axis)
+        grid = np.zeros_like(suffix)
+        head, tail = [slice(None)] * grid.ndim, [slice(None)] * grid.ndim
+        head[axis], tail[axis] = slice(None, -1), slice(1, None)
+        grid[tuple(head)] = suffix[tuple(tail)]
+    return grid
+
+
+def _grid_candidates(points, layers):
+    """Rows that can be on the first `layers` layers.
+
+    Rows are binned on a quantile grid. A row beats every row in a cell
+    strictly below its own on every column, so a row whose cell has a chain
+    of `layers` occupied cells above it, each strictly above the next, lies
+    on a deeper layer.
+    """
+    n, d = points.shape
+    bins = int(min((4 * n) ** (1 / d), MAX_CELLS ** (1 / d)))
+    if bins < 3:
+        return np.ones(n, bool)
+    cell = np.zeros(n, int)
+    for j in range(d):
+        edges = np.quantile(points[:, j], np.linspace(0, 1, bins + 1)[1:-1])
+        cell = cell * bins + np.searchsorted(edges, points[:, j], side="right")
+    occupied = np.zeros(bins ** d, bool)
+    occupied[cell] = True
+    occupied = occupied.reshape((bins,) * d)
+    chain = occupied
+    for _ in range(layers):
+        deeper = _strictly_above(chain)
+        chain = occupied & deeper
+    return ~deeper.reshape(-1)[cell]
+
+
+def _prune(values, index, layers):
+    # Repeat while the grid still removes a good share; each pass bins the
+    # survivors afresh, so the cells follow the remaining front.
+    while len(index):
+        kept = index[_grid_candidates(values[index], layers)]
+        done = len(kept) > 0.75 * len(index)
+        index = kept
+        if done:
+            break
+    return index
+
+
+def skyline(values, layers=1):
+    """Frontier layer (1..layers) of each row of `values` (n, d), 0 beyond; higher is better on every column.
+
+    Equal rows do not dominate each other and share a layer. Rows that the
+    grid rules out are dropped first and the rest are sorted once. Every
+    layer is then peeled from that order: a subset of it is still sorted, so
+    the grid can narrow what is left before each layer without a new sort.
+    """
+    values = np.asarray(values, float)
+    layer = np.zeros(len(values), int)
+    candidates = _prune(values, np.arange(len(values)), layers)
+    if not len(candidates):
+        return layer
+    points, inverse = _sorted_unique(values[candidates])
+    found = np.zeros(len(points), int)
+    remaining = np.arange(len(points))
+    for k in range(1, layers + 1):
+        survivors = _prune(points, remaining, 1)
+        if not len(survivors):
+            break
+        found[survivors[_front(points[survivors])]] = k
+        remaining = remaining[found[remaining] == 0]
+    layer[candidates] = found[inverse]
+    return layer
+
+
+def frontier(conn, ranges, indicators, metrics, maximize, layers=1, relation=store.TABLE):
+    """Display rows on the first `layers` frontier layers of the filter result, best layer first.
+
+    Rows with a missing or infinite value in one of `metrics` are left out.
+    """
+    clause, params = query.where(ranges, indicators)
+    columns = ", ".join(f'"{m}"' for m in metrics)
+    finite = " AND ".join(f'isfinite("{m}"::DOUBLE)' for m in metrics)
+    data = conn.execute(f"SELECT row_id, {columns} FROM {relation} WHERE {clause} AND {finite}", params).fetchnumpy()
+    values = np.column_stack([
+        np.asarray(data[m], float) * (1 if up else -1) for m, up in zip(metrics, maximize)
+    ]) if len(data["row_id"]) else np.empty((0, len(metrics)))
+    layer = skyline(values, layers)
+    row_ids = np.asarray(data["row_id"])[layer > 0]
+    df = conn.execute(f"""
+        {store.display_sql(relation, keep=["row_id"])}
+        WHERE row_id IN (SELECT unnest(?::BIGINT[]))
+    """, [row_ids.tolist()]).df()
+    df.insert(0, LAYER_COLUMN, df["row_id"].map(dict(zip(row_ids.tolist(), layer[layer > 0].tolist()))))
+    df = df.sort_values([LAYER_COLUMN, metrics[0], "row_id"], ascending=[True, not maximize[0], True])
+    return df.drop(columns="row_id").reset_index(drop=True)
@@ -1,15 +1,42 @@
+import uuid
+
 import streamlit as st
-import pandas as pd
-import duckdb
+
+import cache
+import frontier
+import profiling
+import query
+import store
+import summary
 
 # Running Streamlit as Python Module -> python3 -m streamlit run main.py
 
-conn = duckdb.connect()
-df = conn.execute("""
-    SELECT *
-    FROM 'TOP10000.csv'
-""").df()
-pd.set_option("styler.render.max_elements", 4393590)
+
+@st.cache_resource(max_entries=1)
+def get_connection(db_path):
+    # One connection per store version, shared by every session.
+    return store.connect(db_path)
+
+
+@st.cache_resource(max_entries=1)
+def get_cache(db_path):
+    # Shared across sessions and prewarmed with the presets; replaced with the store version.
+    results = cache.ResultCache()
+    conn = get_connection(db_path).cursor()
+    relations = [store.TABLE, store.FULL_VIEW] if store.has_full(conn) else [store.TABLE]
+    cache.prewarm(results, conn, db_path, relations)
+    return results
+
+
+# Opt-in with BACKTEST_PROFILE=1, or ?profile=1 under BACKTEST_PROFILE=url; see profiling.py.
+profile = profiling.Profile(
+    profiling.enabled(st.query_params), st.session_state.setdefault("profile_session", uuid.uuid4().hex[:12]),
+)
+with profile.stage("store"):
+    db_path = store.ensure_store()
+    conn = get_connection(db_path).cursor()
+    results = get_cache(db_path)
+    full = store.has_full(conn)
 
 
 # Streamlit layout
@@ -26,7 +53,13 @@ Website ini dirancang khusus untuk membantu kamu mengevaluasi performa berbagai
 
 
 # Sidebar for filters
-with st.sidebar.form("form_key"):
+# The full result set is scanned lazily from Parquet; the default view is its top 10.000 per indicator.
+use_full = full and st.sidebar.toggle("Versi lengkap backtest", help="Filter seluruh simulasi, bukan hanya 10.000 teratas per indikator.")
+relation = store.FULL_VIEW if use_full else store.TABLE
+
+# Widgets are outside a form so every slider shows, while it is dragged, its
+# distribution under the other filters. The table only follows Apply Filters.
+with st.sidebar:
 
     st.header("Filters")
     col1, col2 = st.columns(2)
@@ -39,38 +72,7 @@ with st.sidebar.form("form_key"):
         sto = st.checkbox("STO", value=True)
         rsi = st.checkbox("RSI", value=True)
 
-    pre_defined_filters = {
-    "No Filter": {
-        "return_range": (0, 200),
-        "returnAnn_range": (0, 10),
-        "sharpe_range": (0.0, 1.0),
-        "drawdown_range": (-70, 0),
-        "trades_range": (0, 300),
-        "win_rate_range": (0, 90),
-        "profit_factor_range": (0, 2000),
-        "avg_trade_range": (0, 50),
-    },
-    "Short Term": {
-        "return_range": (51, 200),
-        "returnAnn_range": (2, 10),
-        "sharpe_range": (0.2, 1.0),
-        "drawdown_range": (-50, 0),
-        "trades_range": (150, 300),
-        "win_rate_range": (50, 90),
-        "profit_factor_range": (0, 2000),
-        "avg_trade_range": (0, 50),
-    },
-    "Long Term": {
-        "return_range": (100, 200),
-        "returnAnn_range": (3, 10),
-        "sharpe_range": (0.3, 1.0),
-        "drawdown_range": (-70, 0),
-        "trades_range": (0, 120),
-        "win_rate_range": (60, 90),
-        "profit_factor_range": (300, 2000),
-        "avg_trade_range": (25, 50),
-    },
-    }
+    pre_defined_filters = query.PRESETS
 
     selected_filter = st.selectbox(
         "Select Preset Filters",
@@ -80,155 +82,148 @@ with st.sidebar.form("form_key"):
 
     filters = pre_defined_filters[selected_filter]
 
-    trades_range = st.slider(
-        "**Total Trades**",
-        min_value=0,
-        max_value=300,
-        value=filters['trades_range'],
-        step=10,
-    )
-
-    drawdown_range = st.slider(
-        "**Max Drawdown [%]**",
-        min_value=-70,
-        max_value=0,
-        value=filters['drawdown_range'],
-        step=1,
-    )
-
-    win_rate_range = st.slider(
-        "**Win Rate [%]**",
-        min_value=0,
-        max_value=90,
-        value=filters['win_rate_range'],
-        step=1,
-    )
-
-    return_range = st.slider(
-        "**Return [%]**",
-        min_value=0,
-        max_value=200,
-        value=filters['return_range'],
-        step=1,
-    )
+    selection, charts = {}, {}
+    for name, (min_value, max_value, step) in query.SLIDERS.items():
+        selection[name] = st.slider(
+            f"**{query.RANGES[name]}**",
+            min_value=min_value,
+            max_value=max_value,
+            value=filters[name],
+            step=step,
+        )
+        charts[name] = st.empty()
 
-    sharpe_range = st.slider(
-        "**Sharpe Ratio**",
+    # Unscored rows (no neighbouring settings) only drop out once a minimum is set.
+    min_robustness = st.slider(
+        "**Robustness** (minimum)",
         min_value=0.0,
         max_value=1.0,
-        value=filters['sharpe_range'],
+        value=0.0,
         step=0.01,
+        help="Seberapa mirip performa pengaturan tetangga (parameter satu langkah di sebelahnya). 1 berarti sama persis.",
     )
-
-    profit_factor_range = st.slider(
-        "**Profit Factor**",
-        min_value=0,
-        max_value=2000,
-        value=filters['profit_factor_range'],
-        step=10,
-    )
-
-    returnAnn_range = st.slider(
-        "**Return Ann [%]**",
-        min_value=0,
-        max_value=10,
-        value=filters['returnAnn_range'],
-        step=1,
+    if min_robustness > 0:
+        selection["robustness_range"] = (min_robustness, 1.0)
+
+    pressed = st.button("Apply Filters")
+
+checked_indicators = [name for name, checked in [
+    ("CCI", cci), ("RSI", rsi), ("MACD", macd), ("STO", sto), ("SMACross", dsma),
+] if checked]
+with profile.stage("facets"):
+    facets = cache.facets(results, conn, db_path, selection, checked_indicators, relation)
+for name, chart in charts.items():
+    facet = facets[name]
+    with chart.container():
+        st.bar_chart({"Nilai": facet["edges"], "Backtest": facet["counts"]}, x="Nilai", y="Backtest", height=90)
+        st.caption(f"{facet['matched']} dari {facet['others']} backtest yang lolos filter lain ada di rentang ini")
+
+# Pareto frontier of the filter result: backtests no other one beats on every chosen metric.
+st.sidebar.header("Pareto Frontier")
+use_frontier = st.sidebar.toggle("Tampilkan frontier", help="Hanya backtest yang tidak kalah dari backtest lain di semua metrik yang dipilih.")
+if use_frontier:
+    frontier_metrics = st.sidebar.multiselect(
+        "Metrik", list(frontier.METRICS), default=frontier.DEFAULT_METRICS, max_selections=4,
     )
-    avg_trade_range = st.slider(
-        "**Avg Trade [%]**",
-        min_value=0,
-        max_value=50,
-        value=filters['avg_trade_range'],
-        step=1,
+    maximize = [
+        st.sidebar.radio(
+            f"**{metric}**", ["Maksimalkan", "Minimalkan"], index=0 if frontier.METRICS[metric] else 1,
+            horizontal=True, key=f"frontier_{metric}",
+        ) == "Maksimalkan"
+        for metric in frontier_metrics
+    ]
+    layers = st.sidebar.number_input(
+        "Jumlah lapisan", min_value=1, max_value=frontier.MAX_LAYERS, value=1,
+        help="Lapisan 2 adalah frontier setelah lapisan 1 dihapus, dan seterusnya.",
     )
 
-    pressed = st.form_submit_button("Apply Filters")
-
-
-final_result = [
-    # Total Trades
-    {
-        'Indicator': ['RSI', 'CCI', 'STO', 'SMACross', 'MACD'],
-        'Total Trades': ['266', '211', '165', '101', '48']
-    },
-    # Max Drawdown
-    {
-        'Indicator': ['RSI', 'SMACross', 'CCI', 'STO', 'MACD'],
-        'Max Drawdown': ['-2.29', '-2.86', '-3.31', '-5.03', '-7.81']
-    },
-    # Win Rate
-    {
-        'Indicator': ['STO', 'MACD', 'CCI', 'RSI', 'SMACross'],
-        'Win Rate': ['85%', '78%', '77%', '76%', '59%']
-    },
-    # Return
-    {
-        'Indicator': ['STO', 'RSI', 'CCI', 'MACD', 'SMACross'],
-        'Return': ['155%', '121%', '107%', '16%', '6%']
-    },
-    # Profit Factor
-    {
-        'Indicator': ['STO', 'RSI', 'CCI', 'MACD', 'SMACross'],
-        'Return': ['1813', '695', '299', '124', '66']
-    },
-    # Sharpe Ratio
-    {
-        'Indicator': ['STO', 'RSI', 'MACD', 'CCI', 'SMACross'],
-        'Sharpe Ratio': ['0.5', '0.37', '0.36', '0.34', '0.33']
-    }
-]
+
+with profile.stage("summary"):
+    final_result = summary.report(conn)
 tab1, tab2 = st.tabs(["Backtest", "Laporan"])
 
 with tab1:
-    if pressed == False:
-        filtered_df = pd.DataFrame()
-        st.subheader("Hasil Backtest")
-        st.write("Menampilkan 50000 backtest dari 50000 backtest")
-        df.reset_index(drop=True, inplace=True)
-        st.dataframe(df, use_container_width=True, hide_index=True)
-        "*hanya menampilkan 10.000 data teratas dari setiap indikator diurutkan berdasarkan Sharpe Ratio"
-    if pressed: 
-        selected_indicators = []
-        if cci:
-            selected_indicators.append("CCI")
-        if rsi:
-            selected_indicators.append("RSI")
-        if macd:
-            selected_indicators.append("MACD")
-        if sto:
-            selected_indicators.append("STO")
-        if dsma:
-            selected_indicators.append("SMACross")
-
-
-        if len(selected_indicators) > 0:
-            indicator_condition = f"REGEXP_MATCHES(\"Indicator Settings\", '{'|'.join(selected_indicators)}', 'i')"
+    # The filter survives reruns triggered by the paging widgets below.
+    if pressed:
+        st.session_state["applied"] = (selection, checked_indicators)
+
+    applied = st.session_state.get("applied")
+    ranges, selected_indicators = applied or ({}, [])
+    hits = results.stats()["hits"]
+    with profile.stage("count"):
+        total = query.total(conn, relation)
+        matched = cache.count(results, conn, db_path, ranges, selected_indicators, relation)
+    clause, params = query.where(ranges, selected_indicators)
+    profile.explain(conn, "count", f"SELECT count(*) FROM {relation} WHERE {clause}", params)
+
+    if use_frontier:
+        st.subheader("Pareto Frontier")
+        if len(frontier_metrics) < 2:
+            st.warning("Pilih 2 sampai 4 metrik untuk frontier.")
         else:
-            indicator_condition = "TRUE"  # Match all rows if no indicators are selected
-        query = f""" 
-        SELECT * 
-        FROM df 
-        WHERE 
-            "Return [%]" BETWEEN {return_range[0]} AND {return_range[1]} AND
-            "Return Ann [%]" BETWEEN {returnAnn_range[0]} AND {returnAnn_range[1]} AND
-            "Sharpe Ratio" BETWEEN {sharpe_range[0]} AND {sharpe_range[1]} AND
-            "Max Drawdown [%]" BETWEEN {drawdown_range[0]} AND {drawdown_range[1]} AND
-            "Total Trades" BETWEEN {trades_range[0]} AND {trades_range[1]} AND
-            "Win Rate [%]" BETWEEN {win_rate_range[0]} AND {win_rate_range[1]} AND
-            "Profit Factor" BETWEEN {profit_factor_range[0]} AND {profit_factor_range[1]} AND
-            "Avg Trade [%]" BETWEEN {avg_trade_range[0]} AND {avg_trade_range[1]} AND
-            {indicator_condition}
-        """
-        filtered_df = duckdb.sql(query).df()
-
-
-        st.subheader("Hasil Filter Backtest")
-        st.write(f"Menampilkan {len(filtered_df)} backtest dari 50000 backtest")
-        filtered_df.reset_index(drop=True, inplace=True)
-        st.dataframe(filtered_df, use_container_width=True, hide_index=True)
+            with profile.stage("frontier"):
+                frontier_df = cache.fetch_frontier(
+                    results, conn, db_path, ranges, selected_indicators, frontier_metrics, maximize, layers, relation,
+                )
+            st.write(f"{len(frontier_df)} backtest di {layers} lapisan frontier dari {matched} backtest hasil filter")
+            with profile.stage("render"):
+                st.dataframe(frontier_df, use_container_width=True, hide_index=True)
+            profile.note(frontier_metrics=frontier_metrics, layers=layers, displayed=len(frontier_df))
+    else:
+        st.subheader("Hasil Filter Backtest" if applied else "Hasil Backtest")
+        columns = list(query.columns(conn, relation))
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            sort_by = st.selectbox("Urutkan", columns, index=columns.index(query.DEFAULT_SORT) if query.DEFAULT_SORT in columns else 0)
+        with col2:
+            descending = st.selectbox("Arah", ["Menurun", "Menaik"]) == "Menurun"
+        with col3:
+            page_size = st.selectbox("Baris per halaman", query.PAGE_SIZES, index=query.PAGE_SIZES.index(query.DEFAULT_PAGE_SIZE))
+        pages = max(1, -(-matched // page_size))
+        with col4:
+            page = st.number_input(f"Halaman (dari {pages})", min_value=1, max_value=pages, value=1) - 1
+
+        # Keyset cursors are only valid for the store version and filter/sort
+        # they were read under: a rebuild reassigns row_ids.
+        view = (db_path, repr(applied), relation, sort_by, descending, page_size)
+        if st.session_state.get("view") != view:
+            st.session_state["view"] = view
+            st.session_state["cursors"] = {}
+        cursors = st.session_state["cursors"]
+        with profile.stage("page"):
+            page_df, cursors[page] = cache.fetch_page(
+                results, conn, db_path, ranges, selected_indicators,
+                sort_by, descending, page_size, page, cursors.get(page - 1), relation,
+            )
+        if profile.enabled:
+            sql, params = query.page_sql(
+                ranges, selected_indicators, sort_by, query.columns(conn, relation)[sort_by],
+                descending, page_size, page, cursors.get(page - 1), relation,
+            )
+            profile.explain(conn, "page", sql, params)
+
+        st.write(f"Menampilkan {matched} backtest dari {total} backtest")
+        with profile.stage("render"):
+            st.dataframe(page_df, use_container_width=True, hide_index=True)
+        profile.note(sort_by=sort_by, page=page, page_size=page_size, displayed=len(page_df))
+    if not use_full:
         "*hanya menampilkan 10.000 data teratas dari setiap indikator diurutkan berdasarkan Sharpe Ratio"
 
+    if profile.enabled:
+        profile.note(relation=relation, filter=repr(applied), matched=matched, cache_hits=results.stats()["hits"] - hits)
+        record = profile.record(conn)
+        profile.write(record)
+        with st.expander("Diagnostik"):
+            st.write(f"Total rerun sampai panel ini: {record['total_ms']:.1f} ms, cache hit: {record['cache_hits']}")
+            st.dataframe(record["stages"], hide_index=True)
+            st.json(record["memory"])
+            for q in profile.queries:
+                if q["available"]:
+                    st.write(f"**{q['query']}**: {q['latency_ms']:.1f} ms, {q['rows_scanned']} baris dipindai")
+                else:
+                    st.write(f"**{q['query']}**: profil tidak tersedia")
+                st.code(q["plan"])
+
 with tab2:
     col1, col2, col3 = st.columns([1,3,1])
     with col2:
@@ -0,0 +1,178 @@
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+import uuid
+import weakref
+from contextlib import contextmanager
+
+# Opt-in profiling of one Streamlit rerun.
+#
+# With BACKTEST_PROFILE=1 main.py times each stage of every rerun, runs the
+# filter queries once more under EXPLAIN ANALYZE for their plan, latency and
+# rows scanned, and tracks peak memory: Python allocations through
+# tracemalloc, DuckDB's buffer pool and the process RSS. With
+# BACKTEST_PROFILE=url only reruns opened with ?profile=1 are profiled; the
+# URL parameter is ignored otherwise, so visitors cannot switch it on. The
+# result is shown in a collapsible panel and appended as one JSON line per
+# rerun to LOG, so it can be aggregated across sessions. Off, every call here
+# is a no-op.
+#
+# tracemalloc is process-wide: it runs only while some profiled rerun is in
+# flight, and its peak is only reported for reruns that had it to themselves.
+
+MODE = os.environ.get("BACKTEST_PROFILE", "")
+ENABLED = MODE not in ("", "0", "url")
+LOG = os.environ.get("BACKTEST_PROFILE_LOG", "profile.jsonl")
+
+_log_lock = threading.Lock()
+_trace_lock = threading.Lock()
+# Profiles between their start and record(); weak so a rerun cut short by
+# the next one does not keep tracing alive.
+_tracing = weakref.WeakSet()
+_started_tracing = False
+
+
+def enabled(query_params=None):
+    if ENABLED:
+        return True
+    return MODE == "url" and query_params is not None and query_params.get("profile") == "1"
+
+
+def _max_rss():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _plan_lines(node, depth=0):
+    lines = []
+    name = node.get("operator_name")
+    if name:
+        lines.append(
+            f"{'  ' * depth}{name}  rows={node.get('operator_cardinality', 0)}"
+            f"  scanned={node.get('operator_rows_scanned', 0)}  {node.get('operator_timing', 0) * 1000:.2f} ms"
+        )
+        depth += 1
+    for child in node.get("children", []):
+        lines += _plan_lines(child, depth)
+    return lines
+
+
+class Profile:
+    """Stage timings, query plans and peak memory of one rerun."""
+
+    def __init__(self, enabled=False, session=None):
+        self.enabled = enabled
+        self.session = session
+        self.stages = []
+        self.queries = []
+        self.values = {}
+        self._start = time.perf_counter()
+        # Whether another profiled rerun shared tracemalloc with this one.
+        self._shared = False
+        if enabled:
+            self._start_tracing()
+
+    def _start_tracing(self):
+        global _started_tracing
+        with _trace_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_tracing = True
+            if _tracing:
+                self._shared = True
+                for other in _tracing:
+                    other._shared = True
+            else:
+                tracemalloc.reset_peak()
+            _tracing.add(self)
+
+    def _stop_tracing(self):
+        global _started_tracing
+        with _trace_lock:
+            _tracing.discard(self)
+            # Only stop tracing this module started, e.g. not PYTHONTRACEMALLOC.
+            if not _tracing and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+
+    def __del__(self):
+        if self.enabled:
+            self._stop_tracing()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({"stage": name, "ms": (time.perf_counter() - start) * 1000})
+
+    def note(self, **values):
+        """Extra context for the record, e.g. the relation or the result size."""
+        if self.enabled:
+            self.values.update(values)
+
+    def explain(self, conn, label, sql, params=()):
+        """Run `sql` under EXPLAIN ANALYZE and keep its plan, latency and rows scanned."""
+        if not self.enabled:
+            return
+        _, plan = conn.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", list(params)).fetchone()
+        plan = json.loads(plan)
+        if plan.get("result") == "error" or "latency" not in plan:
+            # DuckDB has no profile for some plans, e.g. an unfiltered count
+            # of a table, which it answers without running operators.
+            self.queries.append({
+                "query": label,
+                "sql": " ".join(sql.split()),
+                "available": False,
+                "latency_ms": None,
+                "rows_scanned": None,
+                "rows": None,
+                "peak_buffer_bytes": None,
+                "plan": "(DuckDB returned no profile for this query)",
+            })
+            return
+        self.queries.append({
+            "query": label,
+            "sql": " ".join(sql.split()),
+            "available": True,
+            "latency_ms": plan.get("latency", 0) * 1000,
+            "rows_scanned": plan.get("cumulative_rows_scanned"),
+            "rows": plan.get("cumulative_cardinality"),
+            "peak_buffer_bytes": plan.get("system_peak_buffer_memory"),
+            "plan": "\n".join(_plan_lines(plan)),
+        })
+
+    def record(self, conn=None):
+        """The rerun as one JSON-serializable dict; ends its memory tracing.
+
+        python_peak_bytes is None when another profiled rerun ran at the same
+        time, as the peak then covers both.
+        """
+        _, python_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, None)
+        shared = self._shared
+        self._stop_tracing()
+        memory = {"python_peak_bytes": None if shared else python_peak, "max_rss_bytes": _max_rss()}
+        if conn is not None:
+            memory["duckdb_bytes"] = conn.execute("SELECT sum(memory_usage_bytes) FROM duckdb_memory()").fetchone()[0]
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "session": self.session,
+            "rerun": uuid.uuid4().hex[:12],
+            "total_ms": (time.perf_counter() - self._start) * 1000,
+            "stages": self.stages,
+            "queries": [{k: v for k, v in q.items() if k != "plan"} for q in self.queries],
+            "memory": memory,
+            **self.values,
+        }
+
+    def write(self, record, path=LOG):
+        line = json.dumps(record, default=str)
+        with _log_lock, open(path, "a") as f:
+            f.write(line + "\n")
@@ -0,0 +1,228 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+import robustness
+import store
+
+# Sidebar range name -> stored column. Every range becomes a bound BETWEEN.
+RANGES = {
+    "trades_range": "Total Trades",
+    "drawdown_range": "Max Drawdown [%]",
+    "win_rate_range": "Win Rate [%]",
+    "return_range": "Return [%]",
+    "sharpe_range": "Sharpe Ratio",
+    "profit_factor_range": "Profit Factor",
+    "returnAnn_range": "Return Ann [%]",
+    "avg_trade_range": "Avg Trade [%]",
+    "robustness_range": robustness.COLUMN,
+}
+
+# Sidebar range name -> (min, max, step) of its slider, in sidebar order.
+SLIDERS = {
+    "trades_range": (0, 300, 10),
+    "drawdown_range": (-70, 0, 1),
+    "win_rate_range": (0, 90, 1),
+    "return_range": (0, 200, 1),
+    "sharpe_range": (0.0, 1.0, 0.01),
+    "profit_factor_range": (0, 2000, 10),
+    "returnAnn_range": (0, 10, 1),
+    "avg_trade_range": (0, 50, 1),
+}
+
+# Sidebar presets, also used to prewarm the result cache.
+PRESETS = {
+    "No Filter": {
+        "return_range": (0, 200),
+        "returnAnn_range": (0, 10),
+        "sharpe_range": (0.0, 1.0),
+        "drawdown_range": (-70, 0),
+        "trades_range": (0, 300),
+        "win_rate_range": (0, 90),
+        "profit_factor_range": (0, 2000),
+        "avg_trade_range": (0, 50),
+    },
+    "Short Term": {
+        "return_range": (51, 200),
+        "returnAnn_range": (2, 10),
+        "sharpe_range": (0.2, 1.0),
+        "drawdown_range": (-50, 0),
+        "trades_range": (150, 300),
+        "win_rate_range": (50, 90),
+        "profit_factor_range": (0, 2000),
+        "avg_trade_range": (0, 50),
+    },
+    "Long Term": {
+        "return_range": (100, 200),
+        "returnAnn_range": (3, 10),
+        "sharpe_range": (0.3, 1.0),
+        "drawdown_range": (-70, 0),
+        "trades_range": (0, 120),
+        "win_rate_range": (60, 90),
+        "profit_factor_range": (300, 2000),
+        "avg_trade_range": (25, 50),
+    },
+}
+
+PAGE_SIZES = [25, 50, 100, 250]
+DEFAULT_PAGE_SIZE = 50
+DEFAULT_SORT = "Sharpe Ratio"
+FLOAT_TYPES = ("DOUBLE", "FLOAT")
+
+
+def where(ranges, indicators):
+    """WHERE clause and its parameters for the sidebar state.
+
+    Only the ranges present in `ranges` are applied, so `{}` means no filter.
+    An empty indicator selection matches every indicator, like the sidebar did
+    before. Indicators are matched by equality on the ingested `indicator`
+    column; the table is clustered on it, so unselected indicators are skipped
+    by zone maps instead of being regex-scanned.
+    """
+    clauses, params = [], []
+    for name, (low, high) in ranges.items():
+        clauses.append(f'"{RANGES[name]}" BETWEEN ? AND ?')
+        params += [low, high]
+    if indicators:
+        clauses.append(f"indicator IN ({', '.join('?' * len(indicators))})")
+        params += list(indicators)
+    return " AND ".join(clauses) or "TRUE", params
+
+
+def columns(conn, relation=store.TABLE):
+    """Displayed column name -> DuckDB type."""
+    return dict(conn.execute(f"SELECT column_name, column_type FROM (DESCRIBE {store.display_sql(relation)})").fetchall())
+
+
+def count(conn, ranges, indicators, relation=store.TABLE):
+    clause, params = where(ranges, indicators)
+    return conn.execute(f"SELECT count(*) FROM {relation} WHERE {clause}", params).fetchone()[0]
+
+
+def total(conn, relation=store.TABLE):
+    return conn.execute(f"SELECT count(*) FROM {relation}").fetchone()[0]
+
+
+def page_sql(ranges, indicators, sort_by, sort_type, descending, page_size, page=0, after=None, relation=store.TABLE):
+    """One page of results ordered by `sort_by`, ties broken by row_id.
+
+    `after` is the (sort value, row_id) of the last row of the previous page;
+    with it the page is read by keyset instead of OFFSET. NaN and NULL sort
+    keys are folded together and always sorted last, matching how pandas
+    reports them back in the cursor.
+    """
+    clause, params = where(ranges, indicators)
+    key = f'"{sort_by}"'
+    if sort_type in FLOAT_TYPES:
+        key = f"nullif({key}, 'NaN'::DOUBLE)"
+    if after is not None:
+        value, row_id = after
+        if value is None:
+            clause += f" AND {key} IS NULL AND row_id > ?"
+            params += [row_id]
+        else:
+            op = "<" if descending else ">"
+            clause += f" AND ({key} {op} ? OR ({key} = ? AND row_id > ?) OR {key} IS NULL)"
+            params += [value, value, row_id]
+    sql = f"""
+        {store.display_sql(relation, keep=["row_id"])}
+        WHERE {clause}
+        ORDER BY {key} {"DESC" if descending else "ASC"} NULLS LAST, row_id
+        LIMIT {int(page_size)}
+    """
+    if after is None and page:
+        sql += f" OFFSET {int(page) * int(page_size)}"
+    return sql, params
+
+
+def fetch_page(conn, ranges, indicators, sort_by, descending, page_size, page=0, after=None, relation=store.TABLE):
+    """Return (page DataFrame, keyset cursor for the next page)."""
+    sort_type = columns(conn, relation)[sort_by]
+    sql, params = page_sql(ranges, indicators, sort_by, sort_type, descending, page_size, page, after, relation)
+    df = conn.execute(sql, params).df()
+    row_ids = df.pop("row_id")
+    cursor = None
+    if len(df):
+        value = df[sort_by].iloc[-1]
+        if pd.isna(value):
+            value = None
+        elif hasattr(value, "item"):
+            value = value.item()
+        cursor = (value, int(row_ids.iloc[-1]))
+    return df, cursor
+
+
+def _bin_bounds(metric, low, high, integer):
+    """Bins [first, stop) holding the values BETWEEN low AND high.
+
+    Exact for integer columns; for floats only a value equal to `high`, on
+    the edge of a bin, is left out.
+    """
+    start, _, width = store.BINS[metric]
+    first = math.floor((low - start) / width + 1e-9)
+    stop = math.floor((high + integer - start) / width + 1e-9)
+    return first, stop
+
+
+def facets(conn, ranges, indicators, relation=store.TABLE):
+    """Histogram of every slider's metric under the other active filters.
+
+    One grouped pass over the pre-binned columns: each row records which
+    ranges it fails, rows failing two or more are dropped, and a grouping
+    set per slider counts the rest that fail nothing but that slider. Returns
+    range name -> {"edges", "counts"} of the bins inside the slider, plus
+    "others" (rows passing the other filters) and "matched" (of those, the
+    ones inside this slider's range).
+    """
+    types = columns(conn, relation)
+    names = list(SLIDERS)
+    bins = [store.BIN_COLUMNS[RANGES[name]] for name in names]
+    bounds = {
+        name: _bin_bounds(RANGES[name], *ranges[name], types[RANGES[name]] not in FLOAT_TYPES)
+        for name in names if name in ranges
+    }
+    passes, params = [], []
+    for name, column in zip(names, bins):
+        if name in bounds:
+            passes.append(f"coalesce({column} >= ? AND {column} < ?, false)")
+            params += list(bounds[name])
+        else:
+            passes.append("TRUE")
+    # Ranges without a slider, such as Robustness, filter every facet alike.
+    clause, where_params = where({k: v for k, v in ranges.items() if k not in SLIDERS}, indicators)
+    fails = " + ".join(f"(NOT p{i})::INTEGER" for i in range(len(names)))
+    counts = ", ".join(
+        f"count(*) FILTER (WHERE fails = 0 OR NOT p{i}) AS c{i}" for i in range(len(names))
+    )
+    sql = f"""
+        SELECT grouping({", ".join(bins)}) AS grouping_set, {", ".join(bins)}, {counts}
+        FROM (
+            SELECT *, {fails} AS fails
+            FROM (
+                SELECT {", ".join(bins)}, {", ".join(f"{p} AS p{i}" for i, p in enumerate(passes))}
+                FROM {relation}
+                WHERE {clause}
+            )
+        )
+        WHERE fails <= 1
+        GROUP BY GROUPING SETS ({", ".join(f"({b})" for b in bins)})
+    """
+    rows = conn.execute(sql, params + where_params).fetchall()
+    out = {}
+    for i, name in enumerate(names):
+        metric = RANGES[name]
+        start, _, width = store.BINS[metric]
+        hist = np.zeros(store.bin_count(metric) + 2, np.int64)
+        bit = 1 << (len(names) - 1 - i)
+        for row in rows:
+            if not row[0] & bit and row[1 + i] is not None:
+                hist[row[1 + i] + 1] += row[1 + len(names) + i]
+        first, stop = bounds.get(name, (-1, len(hist)))
+        out[name] = {
+            "edges": start + width * np.arange(store.bin_count(metric)),
+            "counts": hist[1:-1],
+            "others": int(hist.sum()),
+            "matched": int(hist[max(first + 1, 0):max(stop + 1, 0)].sum()),
+        }
+    return out
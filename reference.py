@@ -0,0 +1,227 @@
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import engine
+
+# Reference check for the backtest engine.
+#
+# reference/prices holds a small synthetic price set (random walks, one
+# ticker listed late) and reference/expected.csv the metric rows Backtrader
+# produces on it for a few parameter sets per indicator, per ticker and for
+# the three-ticker portfolio. The expected rows are generated independently
+# of engine: signals come from TA-Lib, orders are executed by Backtrader and
+# the metrics are computed from Backtrader's equity curve and fills.
+#
+#     python reference.py               # compare engine.run() with expected.csv
+#     python reference.py --regenerate  # rebuild the set (needs backtrader and TA-Lib)
+
+DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reference")
+PRICES = os.path.join(DIRECTORY, "prices")
+EXPECTED = os.path.join(DIRECTORY, "expected.csv")
+TICKERS = ["AAA", "BBB", "CCC"]
+START, END = "2019-01-01", "2022-12-31"
+CASES = {
+    "RSI": [(14, 30, 70), (5, 39, 91)],
+    "CCI": [(20, -100, 100), (10, -150, 50)],
+    "STO": [(14, 3, 3, 80, 20), (32, 8, 6, 86, 24)],
+    "SMACross": [(10, 50), (20, 100)],
+    "MACD": [(12, 26, 9), (8, 21, 5)],
+}
+RTOL = 1e-9
+
+
+def run_engine():
+    dates, prices = engine.load_prices(PRICES, TICKERS, START, END)
+    frames = []
+    for indicator, params in CASES.items():
+        for row, ticker in enumerate(TICKERS):
+            single = {field: values[[row]] for field, values in prices.items()}
+            frames.append(engine.run(indicator, params, dates, single, ticker))
+        frames.append(engine.run(indicator, params, dates, prices))
+    return pd.concat(frames, ignore_index=True)
+
+
+def check():
+    expected = pd.read_csv(EXPECTED)
+    actual = run_engine()
+    keys = ["Indicator Settings", "Ticker"]
+    merged = expected.merge(actual, on=keys, how="outer", suffixes=("", " (engine)"), indicator=True)
+    failures = [f"missing row {row[keys].tolist()}" for _, row in merged[merged["_merge"] != "both"].iterrows()]
+    for column in engine.COLUMNS[2:]:
+        want = merged[column].to_numpy(float)
+        got = merged[column + " (engine)"].to_numpy(float)
+        bad = ~np.isclose(got, want, rtol=RTOL, atol=1e-9, equal_nan=True)
+        for i in np.flatnonzero(bad & (merged["_merge"] == "both").to_numpy()):
+            failures.append(f"{merged['Indicator Settings'][i]} {merged['Ticker'][i]} {column}: "
+                            f"engine {got[i]!r}, expected {want[i]!r}")
+    for failure in failures:
+        print(failure)
+    print(f"{len(expected)} reference rows, {len(failures)} mismatches")
+    return not failures
+
+
+# Generation
+
+def _synthetic_prices(seed=7):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(START, END)
+    os.makedirs(PRICES, exist_ok=True)
+    for i, ticker in enumerate(TICKERS):
+        close = 1000 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, len(dates))))
+        open_ = close * np.exp(rng.normal(0, 0.005, len(dates)))
+        high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.01, len(dates))))
+        low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.01, len(dates))))
+        df = pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close}, index=dates).round(2)
+        if i == 1:
+            df = df.iloc[60:]  # listed after the start date
+        df.to_csv(os.path.join(PRICES, f"{ticker}.csv"), index_label="Date")
+
+
+def _talib_signals(indicator, params, high, low, close):
+    import talib
+
+    def cross_up(a, b):
+        return (a > b) & (np.roll(a, 1) <= np.roll(b, 1)) & (np.arange(len(a)) > 0)
+
+    def cross_down(a, b):
+        return (a < b) & (np.roll(a, 1) >= np.roll(b, 1)) & (np.arange(len(a)) > 0)
+
+    with np.errstate(invalid="ignore"):
+        if indicator in ("RSI", "CCI"):
+            period, lower, upper = params
+            line = talib.RSI(close, period) if indicator == "RSI" else talib.CCI(high, low, close, period)
+            return line < lower, line > upper
+        if indicator == "STO":
+            k, slowk, slowd, upper, lower = params
+            k_line, d_line = talib.STOCH(high, low, close, fastk_period=k, slowk_period=slowk, slowk_matype=1,
+                                         slowd_period=slowd, slowd_matype=1)
+            return cross_up(k_line, d_line) & (k_line < lower), cross_down(k_line, d_line) & (k_line > upper)
+        if indicator == "SMACross":
+            fast, slow = talib.SMA(close, params[0]), talib.SMA(close, params[1])
+            return cross_up(fast, slow), cross_down(fast, slow)
+        line, signal, _ = talib.MACD(close, *params)
+        return cross_up(line, signal), cross_down(line, signal)
+
+
+def _valid(x):
+    # TA-Lib starts at the first valid value; the late ticker is NaN before it.
+    first = int(np.argmax(~np.isnan(x)))
+    return first, x[first:]
+
+
+def _signals(indicator, params, prices, row):
+    n = prices["close"].shape[1]
+    first, close = _valid(prices["close"][row])
+    entries, exits = np.zeros(n, bool), np.zeros(n, bool)
+    entry, exit_ = _talib_signals(indicator, params, prices["high"][row][first:], prices["low"][row][first:], close)
+    entries[first:], exits[first:] = entry, exit_
+    return entries, exits
+
+
+def _backtrader(dates, prices, rows, entries, exits):
+    """Equity curve and trade returns of the rules in engine, executed by Backtrader."""
+    import backtrader as bt
+
+    curve, trades, entry_price = [], [], {}
+
+    class Strategy(bt.Strategy):
+        def next(self):
+            t = len(self) - 1
+            for j, data in enumerate(self.datas):
+                size = self.getposition(data).size
+                if size > 0 and exits[j][t]:
+                    self.sell(data=data, size=size)
+                elif size == 0 and entries[j][t] and not math.isnan(data.close[0]):
+                    shares = math.floor(self.broker.getcash() * engine.ALLOCATION / data.close[0])
+                    if shares > 0:
+                        self.buy(data=data, size=shares)
+            curve.append(self.broker.getvalue())
+
+        def notify_order(self, order):
+            if order.status == order.Completed:
+                if order.isbuy():
+                    entry_price[order.data._name] = order.executed.price
+                else:
+                    trades.append(order.executed.price / entry_price.pop(order.data._name) - 1)
+
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(engine.INITIAL_CASH)
+    for row in rows:
+        frame = pd.DataFrame(
+            {field: prices[field][row] for field in ("open", "high", "low", "close")},
+            index=pd.DatetimeIndex(dates),
+        ).fillna(0)
+        frame["volume"] = 1e9
+        cerebro.adddata(bt.feeds.PandasData(dataname=frame), name=TICKERS[row])
+    cerebro.addstrategy(Strategy)
+    cerebro.run()
+    # Positions still open are valued at the last close, as the report does.
+    for row in rows:
+        if TICKERS[row] in entry_price:
+            trades.append(prices["close"][row][-1] / entry_price[TICKERS[row]] - 1)
+    return pd.Series(curve, index=pd.DatetimeIndex(dates)), np.array(trades)
+
+
+def _metrics(curve, trades):
+    returns = curve.pct_change().dropna()
+    gmean = np.expm1(np.log1p(returns).mean())
+    annual = (1 + gmean) ** engine.TRADING_DAYS - 1
+    volatility = np.sqrt((returns.var(ddof=1) + (1 + gmean) ** 2) ** engine.TRADING_DAYS
+                         - (1 + gmean) ** (2 * engine.TRADING_DAYS))
+    downside = np.sqrt((returns.clip(upper=0) ** 2).mean()) * np.sqrt(engine.TRADING_DAYS)
+    peak = curve.cummax()
+    drawdown = (1 - curve / peak).max()
+    peak_day = pd.Series(np.where(curve >= peak, curve.index.values, np.datetime64("NaT")), index=curve.index).ffill()
+    duration = (curve.index.to_series() - peak_day).dt.days.max()
+    wins, losses = trades[trades > 0], trades[trades < 0]
+    has = len(trades) > 0
+    return {
+        "Equity Final [Rp]": curve.iloc[-1],
+        "Return [%]": (curve.iloc[-1] / engine.INITIAL_CASH - 1) * 100,
+        "Return Ann [%]": annual * 100,
+        "Sharpe Ratio": annual / volatility if volatility > 0 else np.nan,
+        "Sortino Ratio": annual / downside if downside > 0 else np.nan,
+        "Calmar Ratio": annual / drawdown if drawdown > 0 else np.nan,
+        "Max Drawdown [%]": -drawdown * 100,
+        "Max Drawdown Duration": int(duration),
+        "Total Trades": len(trades),
+        "Win Rate [%]": len(wins) / len(trades) * 100 if has else np.nan,
+        "Profit Factor": wins.sum() / -losses.sum() if len(losses) else np.nan,
+        "Avg Trade [%]": np.expm1(np.log1p(trades).mean()) * 100 if has else np.nan,
+        "Best Trade [%]": trades.max() * 100 if has else np.nan,
+        "Worst Trade [%]": trades.min() * 100 if has else np.nan,
+    }
+
+
+def regenerate():
+    _synthetic_prices()
+    dates, prices = engine.load_prices(PRICES, TICKERS, START, END)
+    rows = []
+    for indicator, cases in CASES.items():
+        for groups, ticker in [([row], TICKERS[row]) for row in range(len(TICKERS))] + [(list(range(len(TICKERS))), "ALL")]:
+            for params in cases:
+                signals = {row: _signals(indicator, params, prices, row) for row in groups}
+                curve, trades = _backtrader(
+                    dates, prices, groups, [signals[r][0] for r in groups], [signals[r][1] for r in groups]
+                )
+                rows.append({
+                    "Indicator Settings": engine.settings(indicator, params),
+                    "Ticker": ticker,
+                    **_metrics(curve, trades),
+                })
+    pd.DataFrame(rows)[engine.COLUMNS].to_csv(EXPECTED, index=False, float_format="%.17g")
+    print(f"wrote {len(rows)} rows to {EXPECTED}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the backtest engine against the Backtrader reference set.")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the reference set with backtrader and TA-Lib")
+    args = parser.parse_args()
+    if args.regenerate:
+        regenerate()
+    sys.exit(0 if check() else 1)
@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+
+# Parameter-neighbourhood robustness of every result row.
+#
+# The parsed parameters of one (indicator, ticker) form an N-dimensional
+# grid: each parameter's distinct values, sorted, are one axis. A row's cell
+# is its position on every axis, and its neighbourhood is that cell plus the
+# adjacent cells one step away along each axis. A setting whose neighbours
+# perform very differently is curve-fitted to the history even when its own
+# Sharpe ratio looks good.
+#
+# The score is computed per grid from the occupied cells only: the mean
+# Sharpe ratio and return of every cell, looked up by flat cell index at one
+# step in both directions along each axis, give the mean and variance of each
+# neighbourhood. Memory follows the rows of one grid, not its volume. The
+# dispersion of both metrics, relative to their spread over the whole grid,
+# becomes
+#
+#     Robustness = 1 / (1 + mean relative dispersion)
+#
+# 1 means the neighbours perform exactly alike; rows without a neighbour get
+# NULL. Cells and scores are kept in TABLE, keyed by row_id, and rebuilt per
+# (indicator, ticker) when rows are added or replaced.
+
+TABLE = "param_grid"
+COLUMN = "Robustness"
+METRICS = ["Sharpe Ratio", "Return [%]"]
+# Grids with more cells than this cannot be indexed by one int64.
+MAX_CELLS = 1 << 62
+
+
+def create(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+            row_id BIGINT, indicator VARCHAR, ticker_code VARCHAR, cell INTEGER[], "{COLUMN}" DOUBLE
+        )
+    """)
+
+
+def _lookup(keys, targets):
+    # Position of each target in the sorted `keys`, and whether it is there.
+    pos = np.searchsorted(keys, targets).clip(max=len(keys) - 1)
+    return pos, keys[pos] == targets
+
+
+def _dispersion(flat, shape, values):
+    """Standard deviation over each row's neighbourhood, relative to the spread of `values`."""
+    ok = np.isfinite(values)
+    if not ok.any():
+        return np.full(len(flat), np.nan)
+    # Mean of every occupied cell, looked up by its flat index.
+    occupied, inverse = np.unique(flat[ok], return_inverse=True)
+    mean = np.bincount(inverse, values[ok]) / np.bincount(inverse)
+    cells, row_cell = np.unique(flat, return_inverse=True)
+    coords = np.unravel_index(cells, shape)
+    strides = np.cumprod([1, *shape[:0:-1]])[::-1]
+    s1, s2, k = np.zeros(len(cells)), np.zeros(len(cells)), np.zeros(len(cells))
+
+    def add(targets, inside=True):
+        pos, hit = _lookup(occupied, targets)
+        hit &= inside
+        s1[hit] += mean[pos[hit]]
+        s2[hit] += mean[pos[hit]] ** 2
+        k[hit] += 1
+
+    add(cells)
+    for axis in range(len(shape)):
+        for step in (1, -1):
+            add(cells + step * strides[axis], (coords[axis] + step >= 0) & (coords[axis] + step < shape[axis]))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sd = np.sqrt(np.maximum(s2 / k - (s1 / k) ** 2, 0))
+    sd[k < 2] = np.nan
+    spread = values[ok].std()
+    row = sd[row_cell]
+    return np.zeros_like(row) if spread == 0 else row / spread
+
+
+def scores(params, metrics):
+    """(cells, robustness) of the rows of one grid.
+
+    `params` is (n, d) with NaN for rows whose settings could not be parsed;
+    `metrics` is a list of (n,) arrays. Those rows get cell -1 and NaN.
+    """
+    n, d = params.shape
+    valid = ~np.isnan(params).any(1)
+    cells = np.full((n, d), -1)
+    robustness = np.full(n, np.nan)
+    if not valid.any() or d == 0:
+        return cells, robustness
+    shape = []
+    for j in range(d):
+        axis, cells[valid, j] = np.unique(params[valid, j], return_inverse=True)
+        shape.append(len(axis))
+    if np.prod(shape, dtype=float) > MAX_CELLS:
+        return cells, robustness
+    flat = np.ravel_multi_index(cells[valid].T, shape)
+    dispersion = np.vstack([_dispersion(flat, shape, m[valid]) for m in metrics])
+    known = np.isfinite(dispersion)
+    with np.errstate(invalid="ignore"):
+        mean = np.where(known, dispersion, 0).sum(0) / known.sum(0)
+    robustness[valid] = 1 / (1 + mean)
+    return cells, robustness
+
+
+def _pairs_sql(pairs, alias):
+    # (indicator, ticker_code) pairs, either of which may be NULL.
+    values = ", ".join("(?, ?)" for _ in pairs)
+    sql = f"""EXISTS (SELECT 1 FROM (VALUES {values}) p(i, t)
+                      WHERE p.i IS NOT DISTINCT FROM {alias}.indicator
+                        AND p.t IS NOT DISTINCT FROM {alias}.ticker_code)"""
+    return sql, [v for pair in pairs for v in pair]
+
+
+def _rebuild_pair(conn, relation, indicator, ticker):
+    # Plain equality, so a partitioned relation only reads the pair's files.
+    clause = "indicator = ? AND " + ("ticker_code = ?" if ticker is not None else "ticker_code IS NULL")
+    params = [indicator] + ([ticker] if ticker is not None else [])
+    dims = conn.execute(f"SELECT coalesce(max(len(params)), 0) FROM {relation} WHERE {clause}", params).fetchone()[0]
+    columns = [f"params[{j + 1}]" for j in range(dims)] + [f'"{m}"' for m in METRICS]
+    names = [f"p{j}" for j in range(dims)] + [f"m{i}" for i in range(len(METRICS))]
+    select = ", ".join(f"coalesce({c}::DOUBLE, 'NaN') AS {n}" for c, n in zip(columns, names))
+    data = conn.execute(f"SELECT row_id, {select} FROM {relation} WHERE {clause}", params).fetchnumpy()
+    if not len(data["row_id"]):
+        return
+    values = np.column_stack([data[f"p{j}"] for j in range(dims)]) if dims else np.empty((len(data["row_id"]), 0))
+    # Trailing NaN columns are parameters this indicator does not have.
+    d = int(np.isfinite(values).any(0).sum())
+    cells, score = scores(values[:, :d], [data[f"m{i}"] for i in range(len(METRICS))])
+    rows = pd.DataFrame({"row_id": data["row_id"], COLUMN: score, **{f"c{j}": cells[:, j] for j in range(d)}})
+    cell = f"list_filter([{', '.join(f'c{j}' for j in range(d))}], c -> c >= 0)" if d else "[]::INTEGER[]"
+    conn.execute(f"""
+        INSERT INTO {TABLE}
+        SELECT row_id, ?, ?, {cell}, nullif("{COLUMN}", 'NaN'::DOUBLE)
+        FROM rows
+    """, [indicator, ticker])
+
+
+def rebuild(conn, relation, pairs=None):
+    """Recompute the grid cells and scores of `pairs` (all when None) from `relation`.
+
+    Each (indicator, ticker) is read and scored on its own, so memory follows
+    the largest grid rather than the whole relation.
+    """
+    create(conn)
+    if pairs is None:
+        conn.execute(f"DELETE FROM {TABLE}")
+        pairs = conn.execute(f"SELECT DISTINCT indicator, ticker_code FROM {relation}").fetchall()
+    elif pairs:
+        clause, params = _pairs_sql(pairs, "x")
+        conn.execute(f"DELETE FROM {TABLE} x WHERE {clause}", params)
+    for indicator, ticker in pairs:
+        # Settings that match no indicator have no grid to score on.
+        if indicator is not None:
+            _rebuild_pair(conn, relation, indicator, ticker)
+
+
+def attach(conn, table, pairs=None):
+    """Copy the scores of `pairs` (all when None) into the Robustness column of `table`."""
+    conn.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS "{COLUMN}" DOUBLE')
+    clause, params = _pairs_sql(pairs, "t") if pairs else ("TRUE", [])
+    conn.execute(f"""
+        UPDATE {table} t SET "{COLUMN}" = g."{COLUMN}"
+        FROM {TABLE} g
+        WHERE t.row_id = g.row_id AND {clause}
+    """, params)
@@ -0,0 +1,105 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+# Indicator series shared across parameter sets.
+#
+# A sweep asks for the same building blocks thousands of times: the SMA of a
+# window, the EMA of a span, the smoothed %K of a stochastic. SeriesCache
+# keeps every series computed by engine under (prices, name, parameters), so
+# each one is computed once per ticker and later parameter sets only look it
+# up. The cache is bounded by bytes and evicts the least recently used series.
+#
+# With a directory, series are also written there as .npy files and read back
+# memory-mapped, so an evicted series (or one computed by another worker or an
+# earlier run on the same prices) is reloaded instead of recomputed.
+
+MAX_BYTES = int(os.environ.get("BACKTEST_SERIES_BYTES", str(512 << 20)))
+DIRECTORY = os.environ.get("BACKTEST_SERIES_DIR") or None
+
+
+def _token(prices):
+    digest = hashlib.sha256()
+    for field in sorted(prices):
+        values = np.ascontiguousarray(prices[field], float)
+        digest.update(f"{field}{values.shape}".encode())
+        digest.update(values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+class SeriesCache:
+    """LRU of indicator series bounded by bytes, optionally backed by memory-mapped files."""
+
+    def __init__(self, max_bytes=MAX_BYTES, directory=DIRECTORY):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.hits = 0
+        self.loads = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def bind(self, prices):
+        """The view of the cache for one price panel, as passed to engine.signals()."""
+        return Series(self, _token(prices))
+
+    def _path(self, key):
+        token, name, values = key
+        return os.path.join(self.directory, token, f"{name}-{'_'.join(f'{v:g}' for v in values)}.npy")
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        if self.directory and os.path.exists(self._path(key)):
+            self.loads += 1
+            value = np.load(self._path(key), mmap_mode="r")
+            self._insert(key, value)
+            return value
+        return None
+
+    def put(self, key, value):
+        self.misses += 1
+        if self.directory:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, value)
+            os.replace(tmp, path)
+        self._insert(key, value)
+
+    def _insert(self, key, value):
+        if value.nbytes > self.max_bytes:
+            return
+        self._entries[key] = value
+        self._bytes += value.nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def stats(self):
+        return {
+            "entries": len(self._entries), "bytes": self._bytes,
+            "hits": self.hits, "loads": self.loads, "misses": self.misses,
+        }
+
+
+class Series:
+    def __init__(self, cache, token):
+        self.cache = cache
+        self.token = token
+
+    def lookup(self, name, values, compute):
+        """Stacked series of `name` for each value (or row) of `values`, computing only the missing ones."""
+        keys = [(self.token, name, tuple(np.atleast_1d(v).tolist())) for v in values]
+        found = [self.cache.get(key) for key in keys]
+        missing = [i for i, value in enumerate(found) if value is None]
+        if missing:
+            for i, value in zip(missing, compute(values[missing])):
+                found[i] = value
+                self.cache.put(keys[i], value)
+        return np.stack(found)
@@ -0,0 +1,454 @@
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+
+import duckdb
+
+import robustness
+import summary
+
+# Columnar store for the backtest results.
+#
+# The exports are ingested once into a DuckDB database file under STORE_DIR.
+# The database file name carries the source hash, so a new export produces a
+# new file and never collides with connections that are still open on the
+# previous one. A small manifest remembers the size/mtime of the source files
+# so the common case (nothing changed) costs a few os.stat calls per rerun.
+#
+# When the full result set (FULL_SOURCE) is present it is written as Parquet
+# partitioned by indicator and ticker and exposed through the FULL_VIEW view,
+# which DuckDB scans lazily. TABLE is then just the top TOP_N rows per
+# indicator materialized from it. Without it, TABLE is built from SOURCE_CSV.
+#
+# Each slider metric also gets a small integer bin column at ingest (BINS),
+# so the sidebar facets are one grouped pass over a few narrow columns. The
+# parameter-neighbourhood score of robustness.py is computed after the rows
+# are in place and stored in robustness.TABLE. Full results are first staged
+# as Parquet, scored, and written out with the score as their Robustness
+# column; TABLE gets it as a column too.
+#
+# append() folds further result files into the current version without a
+# rebuild: new rows are added next to the existing ones and the per-indicator
+# summary is updated by merging partial aggregates. append(replace=True)
+# swaps rows for newer versions of the same simulations instead.
+
+SOURCE_CSV = os.environ.get("BACKTEST_SOURCE", "TOP10000.csv")
+FULL_SOURCE = os.environ.get("BACKTEST_FULL_SOURCE", "FULL.csv")
+STORE_DIR = os.environ.get("BACKTEST_STORE_DIR", "store")
+MEMORY_LIMIT = os.environ.get("BACKTEST_MEMORY_LIMIT", "1GB")
+MANIFEST = "manifest.json"
+LOCK = ".lock"
+# Bump whenever ingest() changes the stored layout, so old stores are rebuilt.
+SCHEMA_VERSION = 9
+
+TABLE = "backtest"
+FULL_VIEW = "backtest_full"
+TOP_N = 10000
+# Best Sharpe ratio first. DuckDB orders NaN above every number, and runs
+# without volatility have a NaN Sharpe ratio, so those go last with NULL.
+SHARPE_DESC = """nullif("Sharpe Ratio", 'NaN'::DOUBLE) DESC NULLS LAST"""
+SETTINGS_COLUMN = "Indicator Settings"
+INDICATORS = ["CCI", "MACD", "SMACross", "STO", "RSI"]
+TICKER_COLUMNS = ["Ticker", "Stock", "Saham", "Symbol"]
+# Metric -> (low, high, width) of the sidebar slider bins, see bin_sql().
+BINS = {
+    "Total Trades": (0, 300, 1),
+    "Max Drawdown [%]": (-70, 0, 1),
+    "Win Rate [%]": (0, 90, 1),
+    "Return [%]": (0, 200, 1),
+    "Sharpe Ratio": (0, 1, 0.01),
+    "Profit Factor": (0, 2000, 10),
+    "Return Ann [%]": (0, 10, 1),
+    "Avg Trade [%]": (0, 50, 1),
+}
+BIN_COLUMNS = {metric: "bin_" + "_".join(re.findall(r"[a-z]+", metric.lower())) for metric in BINS}
+# Columns added at ingest; everything else is the original CSV schema. Names
+# must not clash case-insensitively with source columns such as "Ticker".
+DERIVED_COLUMNS = ["row_id", "indicator", "ticker_code", "params", *BIN_COLUMNS.values()]
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def _locked():
+    # Builds are serialized across threads and across processes: the app, the
+    # API and store.py --append may all find the same source changed at once.
+    os.makedirs(STORE_DIR, exist_ok=True)
+    with _lock, open(os.path.join(STORE_DIR, LOCK), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _files(source):
+    """A source is a CSV/Parquet file or a directory of Parquet files."""
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, "**", "*.parquet"), recursive=True))
+    return [source]
+
+
+def _stat(source):
+    return [[os.path.abspath(f), os.stat(f).st_size, os.stat(f).st_mtime_ns] for f in _files(source)]
+
+
+def _sha256(source):
+    digest = hashlib.sha256()
+    for path in _files(source):
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_manifest():
+    try:
+        with open(os.path.join(STORE_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(manifest):
+    tmp = os.path.join(STORE_DIR, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(STORE_DIR, MANIFEST))
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _config():
+    return {"memory_limit": MEMORY_LIMIT, "temp_directory": os.path.join(STORE_DIR, "tmp")}
+
+
+def reader_sql(source):
+    if os.path.isdir(source):
+        return f"read_parquet({_literal(os.path.join(source, '**', '*.parquet'))}, union_by_name = true)"
+    if source.endswith(".parquet"):
+        return f"read_parquet({_literal(source)})"
+    return f"read_csv({_literal(source)}, header = true, sample_size = -1)"
+
+
+def indicator_sql(column):
+    # Order matters: "SMACross" must not fall through to a later pattern.
+    patterns = [("MACD", "MACD"), ("SMA", "SMACross"), ("CCI", "CCI"), ("RSI", "RSI"), ("STO", "STO")]
+    cases = " ".join(f"WHEN regexp_matches({column}, '{p}', 'i') THEN '{name}'" for p, name in patterns)
+    return f"CASE {cases} END"
+
+
+def params_sql(column):
+    return f"list_transform(regexp_extract_all({column}, '-?\\d+(?:\\.\\d+)?'), x -> x::DOUBLE)"
+
+
+def bin_count(metric):
+    """Bins of `metric` inside its slider range; bin -1 holds the values below, bin_count() those above."""
+    low, high, width = BINS[metric]
+    return round((high - low) / width) + 1
+
+
+def bin_sql(metric):
+    # Bin k holds [low + k * width, low + (k + 1) * width). NaN lands above the
+    # range with the values past it, and NULL stays NULL.
+    low, _, width = BINS[metric]
+    return f'least(greatest(floor(("{metric}" - {low}) / {width}), -1), {bin_count(metric)})::SMALLINT'
+
+
+def _source_select(conn, source):
+    """SELECT over the raw source with the derived columns appended."""
+    reader = reader_sql(source)
+    columns = [row[0] for row in conn.execute(f"DESCRIBE SELECT * FROM {reader}").fetchall()]
+    ticker = next((f'"{c}"' for c in TICKER_COLUMNS if c in columns), "'ALL'")
+    settings = f'"{SETTINGS_COLUMN}"'
+    bins = ",\n                ".join(f"{bin_sql(metric)} AS {column}" for metric, column in BIN_COLUMNS.items())
+    # Rows are clustered by indicator so equality filters on it prune row groups.
+    return f"""
+        SELECT
+            *,
+            row_number() OVER (ORDER BY indicator, {SHARPE_DESC}) AS row_id
+        FROM (
+            SELECT
+                *,
+                {indicator_sql(settings)} AS indicator,
+                {ticker}::VARCHAR AS ticker_code,
+                {params_sql(settings)} AS params,
+                {bins}
+            FROM {reader}
+        )
+        ORDER BY row_id
+    """
+
+
+def ingest(source, db_path, full_dir=None):
+    """Build a fresh database at db_path from source.
+
+    With full_dir, source is the full result set: it is written there as
+    partitioned Parquet and TABLE is materialized as its top TOP_N rows per
+    indicator. Otherwise source is loaded straight into TABLE.
+    """
+    tmp = db_path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = duckdb.connect(tmp, config=_config())
+    try:
+        if full_dir is None:
+            conn.execute(f"CREATE TABLE {TABLE} AS {_source_select(conn, source)}")
+            robustness.rebuild(conn, TABLE)
+            robustness.attach(conn, TABLE)
+        else:
+            shutil.rmtree(full_dir, ignore_errors=True)
+            _write_full(conn, _source_select(conn, source), full_dir)
+            _create_full_view(conn, full_dir)
+            conn.execute(f"""
+                CREATE TABLE {TABLE} AS
+                SELECT * FROM {FULL_VIEW}
+                QUALIFY row_number() OVER (PARTITION BY indicator ORDER BY {SHARPE_DESC}) <= {TOP_N}
+                ORDER BY row_id
+            """)
+        summary.rebuild(conn, FULL_VIEW if full_dir else TABLE)
+    finally:
+        conn.close()
+    os.replace(tmp, db_path)
+
+
+def ensure_store(source=SOURCE_CSV, full_source=FULL_SOURCE):
+    """Return the path of an up-to-date store, (re)ingesting only when a source changed.
+
+    The full result set takes precedence over the top-N CSV when it exists.
+    """
+    full = os.path.exists(full_source)
+    if full:
+        source = full_source
+    db_path = _current(_read_manifest(), source)
+    if db_path:
+        return db_path
+
+    with _locked():
+        # Another process may have built it while this one waited.
+        manifest = _read_manifest()
+        db_path = _current(manifest, source)
+        if db_path:
+            return db_path
+        files = _stat(source)
+        version = f"v{SCHEMA_VERSION}-{_sha256(source)[:16]}"
+        db_name = f"{TABLE}-{version}.duckdb"
+        full_name = f"full-{version}" if full else None
+        db_path = os.path.join(STORE_DIR, db_name)
+        if not os.path.exists(db_path):
+            ingest(source, db_path, full_name and os.path.join(STORE_DIR, full_name))
+        _prune(manifest, db_name, full_name)
+        _write_manifest({"schema": SCHEMA_VERSION, "files": files, "version": version, "db": db_name, "full": full_name})
+    return db_path
+
+
+def _current(manifest, source):
+    """The store path in `manifest` if it is up to date with source, else None."""
+    db_path = os.path.join(STORE_DIR, manifest.get("db", ""))
+    if (
+        manifest.get("schema") == SCHEMA_VERSION
+        and manifest.get("files") == _stat(source)
+        and os.path.exists(db_path)
+    ):
+        return db_path
+    return None
+
+
+def _prune(previous, db_name, full_name):
+    # Sessions in the middle of a rerun may still query the previous version.
+    # Its database file would survive an unlink, but FULL_VIEW re-expands its
+    # Parquet glob on every query, so the previous version is kept as a whole
+    # and only removed once it is superseded again.
+    keep = {db_name, full_name, previous.get("db"), previous.get("full")}
+    for name in os.listdir(STORE_DIR):
+        path = os.path.join(STORE_DIR, name)
+        if name in keep:
+            continue
+        if name.endswith(".duckdb"):
+            os.remove(path)
+        elif name.startswith("full-"):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _link_tree(src, dst, skip=()):
+    for path in _files(src):
+        relative = os.path.relpath(path, src)
+        if os.path.dirname(relative) in skip:
+            continue
+        target = os.path.join(dst, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.link(path, target)
+
+
+def _partition(value):
+    # Directory name DuckDB gives a hive partition value.
+    return "__HIVE_DEFAULT_PARTITION__" if value is None else value
+
+
+def _parquet_sql(directory):
+    files = os.path.join(os.path.abspath(directory), "**", "*.parquet")
+    return f"""read_parquet(
+        {_literal(files)},
+        hive_partitioning = true,
+        hive_types = {{'indicator': VARCHAR, 'ticker_code': VARCHAR}}
+    )"""
+
+
+def _create_full_view(conn, full_dir):
+    conn.execute(f"CREATE OR REPLACE VIEW {FULL_VIEW} AS SELECT * FROM {_parquet_sql(full_dir)}")
+
+
+def _write_full(conn, rows_sql, full_dir, pairs=None):
+    """Add the rows of rows_sql to the partitions in full_dir, scored.
+
+    The rows are every row of the (indicator, ticker) pairs they contain, as
+    a score depends on the whole grid; `pairs` lists those pairs when known.
+    They are staged as Parquet first, so scoring reads one pair at a time.
+    """
+    staging = full_dir + ".staging"
+    shutil.rmtree(staging, ignore_errors=True)
+    conn.execute(f"COPY ({rows_sql}) TO {_literal(staging)} (FORMAT PARQUET, PARTITION_BY (indicator, ticker_code))")
+    try:
+        conn.execute(f"CREATE OR REPLACE TEMP VIEW staged AS SELECT * FROM {_parquet_sql(staging)}")
+        robustness.rebuild(conn, "staged", pairs)
+        conn.execute(f"""
+            COPY (
+                SELECT s.*, g."{robustness.COLUMN}"
+                FROM staged s LEFT JOIN {robustness.TABLE} g USING (row_id)
+                ORDER BY row_id
+            ) TO {_literal(full_dir)}
+            (FORMAT PARQUET, PARTITION_BY (indicator, ticker_code), APPEND)
+        """)
+        conn.execute("DROP VIEW staged")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def append(source, replace=False):
+    """Add the rows of source to the current store as a new version.
+
+    Existing data is reused as is (the database is copied, Parquet files are
+    hard-linked), only the new rows are parsed, only the partitions they land
+    in are rewritten (with fresh robustness scores), and the summary absorbs
+    them through summary.merge(). The appended rows last until the
+    base source changes, which triggers a full rebuild from that source.
+
+    With replace, source is the complete new result for every (indicator,
+    ticker) it contains, e.g. a sweep advanced with new bars: all stored rows
+    of those pairs are dropped, including simulations the new rows no longer
+    cover because they now fall under the sweep's trade filter. The summary
+    of the touched indicators is rebuilt, since maxima cannot be un-merged.
+    """
+    with _locked():
+        manifest = _read_manifest()
+        version = "v{}-{}".format(
+            SCHEMA_VERSION,
+            hashlib.sha256((manifest["version"] + _sha256(source) + ("R" if replace else "")).encode()).hexdigest()[:16],
+        )
+        db_name = f"{TABLE}-{version}.duckdb"
+        db_path = os.path.join(STORE_DIR, db_name)
+        full_name = manifest.get("full") and f"full-{version}"
+        tmp = db_path + ".tmp"
+        shutil.copyfile(os.path.join(STORE_DIR, manifest["db"]), tmp)
+        conn = duckdb.connect(tmp, config=_config())
+        try:
+            dataset = FULL_VIEW if full_name else TABLE
+            start = conn.execute(f"SELECT coalesce(max(row_id), 0) FROM {dataset}").fetchone()[0]
+            conn.execute(f"""
+                CREATE TEMP TABLE new_rows AS
+                SELECT * REPLACE (row_id + {start} AS row_id) FROM ({_source_select(conn, source)})
+            """)
+            touched = conn.execute("SELECT DISTINCT indicator, ticker_code FROM new_rows").fetchall()
+            indicators = sorted({indicator for indicator, _ in touched if indicator})
+            # Settings that match no indicator pattern have a NULL indicator.
+            same_pair = """
+                EXISTS (SELECT 1 FROM new_rows n
+                        WHERE n.indicator IS NOT DISTINCT FROM old.indicator
+                          AND n.ticker_code IS NOT DISTINCT FROM old.ticker_code)
+            """
+            same_indicator = "EXISTS (SELECT 1 FROM new_rows n WHERE n.indicator IS NOT DISTINCT FROM old.indicator)"
+            if full_name:
+                full_dir = os.path.join(STORE_DIR, full_name)
+                shutil.rmtree(full_dir, ignore_errors=True)
+                # Touched partitions are rewritten whole: the scores of their
+                # existing rows change with the new neighbours.
+                skip = {f"indicator={_partition(i)}/ticker_code={_partition(t)}" for i, t in touched}
+                _link_tree(os.path.join(STORE_DIR, manifest["full"]), full_dir, skip)
+                rows = "SELECT * FROM new_rows"
+                if not replace:
+                    rows = f"""
+                        SELECT * EXCLUDE ("{robustness.COLUMN}") FROM {FULL_VIEW} old WHERE {same_pair}
+                        UNION ALL BY NAME {rows}
+                    """
+                _write_full(conn, rows, full_dir, touched)
+                _create_full_view(conn, full_dir)
+                if replace:
+                    conn.execute(f"""
+                        CREATE OR REPLACE TABLE {TABLE} AS
+                        SELECT * FROM (
+                            SELECT * FROM {TABLE} old WHERE NOT {same_indicator}
+                            UNION ALL BY NAME
+                            SELECT * FROM {FULL_VIEW} old WHERE {same_indicator}
+                        )
+                        QUALIFY row_number() OVER (PARTITION BY indicator ORDER BY {SHARPE_DESC}) <= {TOP_N}
+                        ORDER BY indicator, {SHARPE_DESC}
+                    """)
+                else:
+                    # The top N of (old top N + new rows) is the top N of everything.
+                    conn.execute(f"""
+                        CREATE OR REPLACE TABLE {TABLE} AS
+                        SELECT * FROM (SELECT * FROM {TABLE} UNION ALL BY NAME SELECT * FROM new_rows)
+                        QUALIFY row_number() OVER (PARTITION BY indicator ORDER BY {SHARPE_DESC}) <= {TOP_N}
+                        ORDER BY indicator, {SHARPE_DESC}
+                    """)
+            else:
+                if replace:
+                    conn.execute(f"DELETE FROM {TABLE} old WHERE {same_pair}")
+                conn.execute(f"INSERT INTO {TABLE} BY NAME SELECT * FROM new_rows")
+                robustness.rebuild(conn, TABLE, touched)
+            # Neighbours of the new rows change score too.
+            robustness.attach(conn, TABLE, touched)
+            if replace:
+                summary.rebuild(conn, dataset, indicators)
+            else:
+                summary.merge(conn, "new_rows")
+        finally:
+            conn.close()
+        os.replace(tmp, db_path)
+        _prune(manifest, db_name, full_name)
+        manifest.update(version=version, db=db_name, full=full_name)
+        _write_manifest(manifest)
+    return db_path
+
+
+def connect(db_path):
+    """Read-only connection shared by every session; use .cursor() per thread."""
+    return duckdb.connect(db_path, read_only=True, config=_config())
+
+
+def has_full(conn):
+    return conn.execute("SELECT count(*) FROM duckdb_views() WHERE view_name = ?", [FULL_VIEW]).fetchone()[0] > 0
+
+
+def display_sql(relation=TABLE, keep=()):
+    hidden = [c for c in DERIVED_COLUMNS if c not in keep]
+    return f"SELECT * EXCLUDE ({', '.join(hidden)}) FROM {relation}"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or extend the backtest result store.")
+    parser.add_argument("--append", metavar="SOURCE", help="add the rows of a CSV/Parquet file or Parquet directory")
+    parser.add_argument("--replace", metavar="SOURCE", help="like --append, replacing rows with the same settings and ticker")
+    args = parser.parse_args()
+    print(ensure_store())
+    if args.append:
+        print(append(args.append))
+    if args.replace:
+        print(append(args.replace, replace=True))
@@ -0,0 +1,91 @@
+# Per-indicator summary behind the "Laporan" tables.
+#
+# The summary table stores mergeable partial aggregates (counts, sums and
+# maxima) per indicator. merge() folds any set of new rows into it with one
+# grouped pass and an upsert, so ingesting more simulations never rescans the
+# rows that were already summarized. The report values are derived from the
+# partials when the tables are rendered.
+
+TABLE = "indicator_summary"
+
+# Partial aggregate column -> (SQL aggregate over new rows, merge expression).
+AGGREGATES = {
+    "row_count": ("count(*)", "row_count + excluded.row_count"),
+    "trades_sum": ('sum("Total Trades")', "trades_sum + excluded.trades_sum"),
+    "trades_count": ('count("Total Trades")', "trades_count + excluded.trades_count"),
+    "drawdown_max": ('max("Max Drawdown [%]") FILTER (WHERE isfinite("Max Drawdown [%]"))', None),
+    "win_rate_max": ('max("Win Rate [%]") FILTER (WHERE isfinite("Win Rate [%]"))', None),
+    "return_max": ('max("Return [%]") FILTER (WHERE isfinite("Return [%]"))', None),
+    "profit_factor_max": ('max("Profit Factor") FILTER (WHERE isfinite("Profit Factor"))', None),
+    "sharpe_max": ('max("Sharpe Ratio") FILTER (WHERE isfinite("Sharpe Ratio"))', None),
+}
+
+
+def create(conn):
+    columns = ", ".join(f"{name} DOUBLE" for name in AGGREGATES)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (indicator VARCHAR PRIMARY KEY, {columns})")
+
+
+def merge(conn, relation, where="TRUE", params=()):
+    """Fold the rows of `relation` matching `where` (with bound `params`) into the summary in a single grouped pass."""
+    create(conn)
+    select = ", ".join(f"{agg} AS {name}" for name, (agg, _) in AGGREGATES.items())
+    updates = ", ".join(
+        f"{name} = {merge_sql or f'greatest({name}, excluded.{name})'}"
+        for name, (_, merge_sql) in AGGREGATES.items()
+    )
+    conn.execute(f"""
+        INSERT INTO {TABLE}
+        SELECT indicator, {select}
+        FROM {relation}
+        WHERE indicator IS NOT NULL AND {where}
+        GROUP BY indicator
+        ON CONFLICT (indicator) DO UPDATE SET {updates}
+    """, list(params))
+
+
+def rebuild(conn, relation, indicators=None):
+    """Recompute the summary of `indicators` (all when None) from scratch.
+
+    Needed when rows are replaced rather than added, since maxima cannot be
+    un-merged.
+    """
+    create(conn)
+    if indicators is None:
+        conn.execute(f"DELETE FROM {TABLE}")
+        merge(conn, relation)
+        return
+    if not indicators:
+        return
+    placeholders = ", ".join("?" * len(indicators))
+    conn.execute(f"DELETE FROM {TABLE} WHERE indicator IN ({placeholders})", list(indicators))
+    merge(conn, relation, f"indicator IN ({placeholders})", indicators)
+
+
+def _table(rows, title, column, fmt, descending=True):
+    rows = sorted((r for r in rows if r[column] is not None), key=lambda r: r[column], reverse=descending)
+    return {"Indicator": [r["indicator"] for r in rows], title: [fmt(r[column]) for r in rows]}
+
+
+def per_indicator(conn):
+    """The summary row of every indicator as a dict, with the average trade count."""
+    cursor = conn.execute(f"""
+        SELECT *, trades_sum / nullif(trades_count, 0) AS trades_avg
+        FROM {TABLE}
+        ORDER BY indicator
+    """)
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def report(conn):
+    """The six report tables, in the layout the Laporan tab renders."""
+    rows = per_indicator(conn)
+    return [
+        _table(rows, "Total Trades", "trades_avg", lambda v: f"{v:.0f}"),
+        _table(rows, "Max Drawdown", "drawdown_max", lambda v: f"{v:.2f}"),
+        _table(rows, "Win Rate", "win_rate_max", lambda v: f"{v:.0f}%"),
+        _table(rows, "Return", "return_max", lambda v: f"{v:.0f}%"),
+        _table(rows, "Profit Factor", "profit_factor_max", lambda v: f"{v:.0f}"),
+        _table(rows, "Sharpe Ratio", "sharpe_max", lambda v: f"{v:.2f}"),
+    ]
@@ -0,0 +1,234 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import duckdb
+import numpy as np
+
+import engine
+import series
+
+# Parameter sweep over (indicator, parameter grid, ticker).
+#
+# The space is split into chunks of parameter sets for one indicator and one
+# ticker (or the whole portfolio) and run on a process pool. Every finished
+# chunk is written as its own Parquet shard under <out>/shards, its final
+# simulation state under <out>/state, and recorded in <out>/manifest.jsonl,
+# so an interrupted sweep picks up where it stopped. When new daily bars
+# arrive, --update advances the saved states over just those bars and
+# rewrites the shards, instead of running the whole history again.
+# Each worker keeps a series.SeriesCache, so indicator series are computed
+# once per ticker rather than once per chunk. The shard directory is a valid
+# store source:
+#
+#     BACKTEST_FULL_SOURCE=<out>/shards streamlit run main.py
+#     python store.py --append <out>/shards
+
+TICKERS = [
+    "ADRO", "AKRA", "ASII", "BBCA", "BBRI", "BBNI", "BMRI", "INCO",
+    "INDF", "ITMG", "MAPI", "MEDC", "PTBA", "TLKM", "UNTR",
+]
+PORTFOLIO = "ALL"
+
+GRIDS = {
+    "RSI": {"period": range(2, 31), "lower": range(10, 50, 5), "upper": range(55, 100, 5)},
+    "CCI": {"period": range(5, 65, 5), "lower": range(-300, 0, 50), "upper": range(50, 350, 50)},
+    "STO": {
+        "k": range(5, 41, 3),
+        "slowk": range(2, 11, 2),
+        "slowd": range(2, 11, 2),
+        "upper": range(60, 100, 10),
+        "lower": range(10, 50, 10),
+    },
+    "SMACross": {"fast": range(5, 55, 5), "slow": range(20, 210, 10)},
+    "MACD": {"fast": range(5, 23, 3), "slow": range(20, 65, 5), "signal": range(5, 23, 3)},
+}
+
+
+def grid(indicator):
+    """Every valid parameter set of `indicator`, ordered as engine.PARAMS."""
+    names = engine.PARAMS[indicator]
+    params = np.array(list(itertools.product(*(GRIDS[indicator][name] for name in names))), float)
+    if "lower" in names:
+        params = params[params[:, names.index("lower")] < params[:, names.index("upper")]]
+    if "fast" in names:
+        params = params[params[:, names.index("fast")] < params[:, names.index("slow")]]
+    return params
+
+
+def chunks(indicators, tickers, chunk_size):
+    for indicator in indicators:
+        params = grid(indicator)
+        for ticker in tickers:
+            for start in range(0, len(params), chunk_size):
+                yield f"{indicator}-{ticker}-{start:07d}", indicator, ticker, params[start:start + chunk_size]
+
+
+_dates = _prices = _tickers = _series = None
+
+
+def _load(directory, tickers, start, end, series_dir):
+    global _dates, _prices, _tickers, _series
+    _dates, _prices = engine.load_prices(directory, tickers, start, end)
+    _tickers = tickers
+    _series = series.SeriesCache(directory=series_dir)
+
+
+def _paths(out, chunk_id):
+    return os.path.join(out, "shards", chunk_id + ".parquet"), os.path.join(out, "state", chunk_id + ".npz")
+
+
+def _run_chunk(chunk_id, indicator, ticker, params, out, resume=False):
+    began = time.perf_counter()
+    shard, state_path = _paths(out, chunk_id)
+    if ticker == PORTFOLIO:
+        prices = _prices
+    else:
+        row = _tickers.index(ticker)
+        prices = {field: values[[row]] for field, values in _prices.items()}
+    state, _ = engine.load_state(state_path) if resume else (engine.new_state(len(params), len(prices["close"])), None)
+    df = engine.run(indicator, params, _dates, prices, ticker, _series.bind(prices), state)
+    # The state goes first: a shard is only ever newer than its state, and
+    # re-applying a state to bars it has already seen is a no-op.
+    engine.save_state(state_path, state, indicator=indicator, ticker=ticker, params=params)
+    # As in the report: runs without a single trade and 100% win rates are left out.
+    df = df[(df["Total Trades"] > 0) & (df["Win Rate [%]"] < 100)]
+    tmp = shard + ".tmp"
+    duckdb.from_df(df).write_parquet(tmp)
+    os.replace(tmp, shard)
+    return chunk_id, len(params), len(df), time.perf_counter() - began
+
+
+def _completed(out):
+    done = set()
+    try:
+        with open(os.path.join(out, "manifest.jsonl")) as f:
+            for line in f:
+                entry = json.loads(line)
+                if all(os.path.exists(path) for path in _paths(out, entry["chunk"])):
+                    done.add(entry["chunk"])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _read_config(out):
+    try:
+        with open(os.path.join(out, "sweep.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_config(out, config):
+    tmp = os.path.join(out, "sweep.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp, os.path.join(out, "sweep.json"))
+
+
+def _check_config(out, config):
+    existing = _read_config(out)
+    if existing is None:
+        _write_config(out, config)
+    elif existing != config:
+        raise SystemExit(f"{out} holds a sweep with different settings; use another --out")
+
+
+def _duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds // 60 % 60:02d}m{seconds % 60:02d}s"
+
+
+def sweep(prices, out, indicators, tickers, chunk_size=256, workers=None, portfolio=False,
+          start="2012-01-01", end="2022-12-31", series_dir=series.DIRECTORY):
+    config = {
+        "indicators": indicators,
+        "tickers": tickers,
+        "portfolio": portfolio,
+        "chunk_size": chunk_size,
+        "start": start,
+        "end": end,
+        "grids": hashlib.sha256(repr({i: GRIDS[i] for i in indicators}).encode()).hexdigest(),
+    }
+    os.makedirs(os.path.join(out, "shards"), exist_ok=True)
+    os.makedirs(os.path.join(out, "state"), exist_ok=True)
+    _check_config(out, config)
+
+    todo = list(chunks(indicators, [PORTFOLIO] if portfolio else tickers, chunk_size))
+    done = _completed(out)
+    pending = [c for c in todo if c[0] not in done]
+    total_sims = sum(len(c[3]) for c in pending)
+    print(f"{len(todo)} chunks, {len(done)} already done, {len(pending)} to run ({total_sims} simulations)")
+
+    with open(os.path.join(out, "manifest.jsonl"), "a") as manifest:
+        _execute(pending, out, (prices, tickers, start, end, series_dir), workers, manifest)
+    return os.path.join(out, "shards")
+
+
+def _execute(pending, out, initargs, workers, manifest=None, resume=False):
+    total_sims = sum(len(c[3]) for c in pending)
+    began = time.perf_counter()
+    sims = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load, initargs=initargs) as pool:
+        futures = [pool.submit(_run_chunk, *chunk, out, resume) for chunk in pending]
+        for n, future in enumerate(as_completed(futures), 1):
+            chunk_id, chunk_sims, rows, seconds = future.result()
+            if manifest:
+                manifest.write(json.dumps({"chunk": chunk_id, "simulations": chunk_sims, "rows": rows,
+                                           "seconds": round(seconds, 3)}) + "\n")
+                manifest.flush()
+            sims += chunk_sims
+            elapsed = time.perf_counter() - began
+            rate = sims / elapsed
+            print(f"[{n}/{len(pending)}] {chunk_id}: {rate:.0f} sims/s, "
+                  f"elapsed {_duration(elapsed)}, ETA {_duration((total_sims - sims) / rate)}", flush=True)
+
+
+def update(prices, out, end, workers=None, series_dir=series.DIRECTORY):
+    """Extend a finished sweep to `end`, simulating only the bars after its saved states.
+
+    Chunks the sweep has not finished yet are left to a later `sweep` run,
+    which then covers the new end date as well.
+    """
+    config = _read_config(out)
+    if config is None:
+        raise SystemExit(f"{out} holds no sweep to update")
+    if end < config["end"]:
+        raise SystemExit(f"{out} already runs to {config['end']}; the end date can only move forward")
+    pending = []
+    for chunk_id in sorted(_completed(out)):
+        with np.load(_paths(out, chunk_id)[1]) as state:
+            pending.append((chunk_id, str(state["indicator"]), str(state["ticker"]), state["params"]))
+    print(f"{len(pending)} chunks to advance from {config['end']} to {end}")
+    tickers = config["tickers"]
+    _execute(pending, out, (prices, tickers, config["start"], end, series_dir), workers, resume=True)
+    _write_config(out, dict(config, end=end))
+    return os.path.join(out, "shards")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the indicator parameter sweep into Parquet shards.")
+    parser.add_argument("--prices", required=True, help="directory with one <TICKER>.csv (Date,Open,High,Low,Close) per ticker")
+    parser.add_argument("--out", default="sweep")
+    parser.add_argument("--indicators", nargs="+", default=list(GRIDS), choices=list(GRIDS))
+    parser.add_argument("--tickers", nargs="+", default=TICKERS)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of CPUs")
+    parser.add_argument("--portfolio", action="store_true", help="trade all tickers together from one cash balance")
+    parser.add_argument("--start", default="2012-01-01")
+    parser.add_argument("--end", default="2022-12-31")
+    parser.add_argument("--series-dir", default=series.DIRECTORY,
+                        help="keep indicator series here as memory-mapped files, shared by the workers")
+    parser.add_argument("--update", action="store_true",
+                        help="advance a finished sweep in --out to --end, simulating only the new bars")
+    args = parser.parse_args()
+    if args.update:
+        print(update(args.prices, args.out, args.end, args.workers, args.series_dir))
+    else:
+        print(sweep(args.prices, args.out, args.indicators, args.tickers, args.chunk_size, args.workers,
+                    args.portfolio, args.start, args.end, args.series_dir))